@@ -8,7 +8,7 @@ from pages.templatetags.pages_tags import PlaceholderNode
 from pages.admin.forms import make_form
 from pages.admin.views import traduction, get_reversion_content, sub_menu
 from pages.admin.views import change_status, modify_content, delete_content
-from pages.admin.views import move_page
+from pages.admin.views import move_page, move_targets
 
 from collections import defaultdict
 from django.contrib import admin
@@ -107,6 +107,8 @@ class PageAdmin(admin.ModelAdmin):
                 sub_menu, name='page-sub-menu'),
             url(r'^(?P<page_id>[0-9]+)/move-page/$',
                 move_page, name='page-move-page'),
+            url(r'^(?P<page_id>[0-9]+)/move-targets/$',
+                move_targets, name='page-move-targets'),
             url(r'^(?P<page_id>[0-9]+)/change-status/$',
                 change_status, name='page-change-status'),
         ]
@@ -334,7 +336,8 @@ class PageAdmin(admin.ModelAdmin):
         else:
             pages = Page.objects.root()
 
-        pages = pages.prefetch_related('children')
+        pages = pages.prefetch_related('children').prefetch_content(
+            ctypes=['title'])
         pages = Paginator(pages, self.list_per_page).page(page)
 
         context = {
@@ -85,7 +85,7 @@ def make_form(model_, placeholders):
 
             new_url = Page.build_complete_slug(parent, slug)
 
-            if Page.objects.from_complete_slug(complete_slug=new_url).exclude(id=self.instance.id).exists():
+            if Page.objects.with_complete_slug(new_url, self.instance.id).exists():
                 raise forms.ValidationError('This URL is already taken by another active page.')
             return slug
 
@@ -7,6 +7,9 @@ from pages.phttp import get_language_from_request
 
 from django.shortcuts import get_object_or_404, render
 from django.http import HttpResponse, Http404, HttpResponseRedirect
+from django.http import JsonResponse
+from django.core.paginator import Paginator, InvalidPage
+from django.db.models import Q
 from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.csrf import csrf_exempt
 from django.core.urlresolvers import reverse
@@ -31,7 +34,7 @@ change_status = staff_member_required(change_status)
 def list_pages_ajax(request, invalid_move=False):
     """Render pages table for ajax function."""
     language = get_language_from_request(request)
-    pages = Page.objects.root()
+    pages = Page.objects.root().prefetch_content(ctypes=['title'])
     context = {
         'can_publish': request.user.has_perm('pages.can_publish'),
         'invalid_move':invalid_move,
@@ -142,11 +145,43 @@ def move_page(request, page_id, extra_context=None):
     return HttpResponseRedirect('../../')
 
 
+def move_targets(request, page_id):
+    """Return a page of the valid move targets of a page in JSON,
+    optionally filtered by a search on their title and slug."""
+    page = get_object_or_404(Page, pk=page_id)
+    language = get_language_from_request(request)
+    query = request.GET.get('q', '').strip()
+
+    targets = page.valid_targets()
+    if query:
+        targets = targets.filter(Q(complete_slug__icontains=query) |
+            Q(content__type='title', content__is_current=True,
+                content__body__icontains=query)).distinct()
+    # every language, the titles fall back on the other languages
+    targets = targets.order_by('tree_id', 'lft').prefetch_content(
+        ctypes=['title'])
+    try:
+        targets = Paginator(targets, 50).page(request.GET.get('p', 1))
+    except InvalidPage:
+        raise Http404
+    return JsonResponse({
+        'targets': [{
+            'id': target.id,
+            'title': target.title(language),
+            'complete_slug': target.complete_slug,
+            'level': target.level,
+        } for target in targets],
+        'page': targets.number,
+        'num_pages': targets.paginator.num_pages,
+    })
+move_targets = staff_member_required(move_targets)
+
+
 def sub_menu(request, page_id):
     """Render the children of the requested page with the sub_menu
     template."""
     page = Page.objects.get(id=page_id)
-    pages = page.children.all()
+    pages = page.children.all().prefetch_content(ctypes=['title'])
     page_languages = settings.PAGE_LANGUAGES
     return render(request, "admin/pages/page/sub_menu.html", {
         'can_publish': request.user.has_perm('pages.can_publish'),
@@ -2,8 +2,280 @@
 
 from django.core.cache import caches
 from django.core.cache.backends.base import InvalidCacheBackendError
+from django.core.signals import request_finished
+from django.db import transaction
 
-try:
-    cache = caches['pages']
-except InvalidCacheBackendError:
-    cache = caches['default']
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache(object):
+    """A bounded, thread safe, in-process cache that evicts the least
+    recently used entries first.
+
+    :param maxsize: the maximum number of entries, ``0`` disables the cache.
+    :param timeout: the number of seconds an entry stays valid, ``None``
+        for no expiration.
+    """
+
+    def __init__(self, maxsize=1000, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the value stored for the key, ``default`` if there is
+        none or if it has expired."""
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < time.time():
+                self.misses += 1
+                return default
+            # move the entry to the most recently used end
+            self._data[key] = (value, expires)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store the value, the least recently used entry is evicted
+        when the cache is full."""
+        if not self.maxsize:
+            return
+        expires = None
+        if self.timeout is not None:
+            expires = time.time() + self.timeout
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache(object):
+    """A Django cache with a :class:`LRUCache` in front of it, in the
+    memory of the process.
+
+    Every write and delete goes through both tiers, so the local copies
+    are invalidated by the process that changes a page. The other
+    processes see the change when their local copy expires.
+    The values of the local tier are shared and should not be modified.
+
+    :param backend: the Django cache.
+    :param maxsize: the maximum number of local entries.
+    :param timeout: the number of seconds a local entry stays valid.
+    """
+
+    # marks a missing value, None is a valid cache value
+    missing = object()
+
+    def __init__(self, backend, maxsize=1000, timeout=5):
+        self.backend = backend
+        self.local = LRUCache(maxsize, timeout)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def get(self, key, default=None):
+        value = self.local.get(key, self.missing)
+        if value is self.missing:
+            value = self.backend.get(key, self.missing)
+            if value is self.missing:
+                return default
+            self.local.set(key, value)
+        return value
+
+    def get_many(self, keys):
+        values = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key, self.missing)
+            if value is self.missing:
+                missing.append(key)
+            else:
+                values[key] = value
+        if missing:
+            fetched = self.backend.get_many(missing)
+            for key, value in fetched.items():
+                self.local.set(key, value)
+            values.update(fetched)
+        return values
+
+    def set(self, key, value, *args, **kwargs):
+        self.backend.set(key, value, *args, **kwargs)
+        self.local.set(key, value)
+
+    def set_many(self, data, *args, **kwargs):
+        self.backend.set_many(data, *args, **kwargs)
+        for key, value in data.items():
+            self.local.set(key, value)
+
+    def add(self, key, value, *args, **kwargs):
+        added = self.backend.add(key, value, *args, **kwargs)
+        if added:
+            self.local.set(key, value)
+        else:
+            self.local.delete(key)
+        return added
+
+    def incr(self, key, *args, **kwargs):
+        self.local.delete(key)
+        value = self.backend.incr(key, *args, **kwargs)
+        self.local.set(key, value)
+        return value
+
+    def delete(self, key, *args, **kwargs):
+        self.local.delete(key)
+        self.backend.delete(key, *args, **kwargs)
+
+    def delete_many(self, keys, *args, **kwargs):
+        keys = list(keys)
+        for key in keys:
+            self.local.delete(key)
+        self.backend.delete_many(keys, *args, **kwargs)
+
+    def clear(self):
+        self.local.clear()
+        self.backend.clear()
+
+
+def get_cache():
+    """Return the cache used by the pages: the ``pages`` Django cache or
+    the ``default`` one, with a local tier in front of it when
+    ``PAGE_CACHE_LOCAL_SIZE`` is set."""
+    from pages import settings
+    try:
+        backend = caches['pages']
+    except InvalidCacheBackendError:
+        backend = caches['default']
+    if not settings.PAGE_CACHE_LOCAL_SIZE:
+        return backend
+    return TwoTierCache(backend, settings.PAGE_CACHE_LOCAL_SIZE,
+        settings.PAGE_CACHE_LOCAL_TIMEOUT)
+
+cache = get_cache()
+
+
+class InvalidationQueue(object):
+    """The invalidations of a transaction, run once when it commits.
+
+    The queue registers itself with ``transaction.on_commit`` once per
+    savepoint level: an addition made where an earlier registration is
+    still active doesn't register it again. When a savepoint rolls back,
+    the next addition registers it again. A single run flushes
+    everything, none happens if the transaction rolls back."""
+
+    def __init__(self):
+        self.flushes = OrderedDict()
+        # the savepoints the queue is registered in, None for the
+        # transaction itself
+        self.levels = set()
+
+    def add(self, flush, key=None, item=None):
+        items = self.flushes.setdefault(flush, OrderedDict())
+        if key is not None:
+            items[key] = item
+        self.register()
+
+    def register(self):
+        """Register the queue with ``transaction.on_commit``, unless it
+        is registered in the current savepoint or in an enclosing one."""
+        savepoint_ids = [sid for sid in
+            transaction.get_connection().savepoint_ids if sid is not None]
+        if None in self.levels or self.levels.intersection(savepoint_ids):
+            return
+        self.levels.add(savepoint_ids[-1] if savepoint_ids else None)
+        transaction.on_commit(self)
+
+    def __call__(self):
+        self.levels.clear()
+        flushes, self.flushes = self.flushes, OrderedDict()
+        for flush, items in flushes.items():
+            flush(list(items.values()))
+
+
+# the invalidation queue of each database connection of the thread
+_queues = threading.local()
+
+
+def forget_invalidation_queues(**kwargs):
+    """Drop the queues of the thread, what is left in them was rolled
+    back. Connected to ``request_finished``, so a request that starts
+    its transaction right away doesn't inherit them."""
+    _queues.__dict__.clear()
+
+request_finished.connect(forget_invalidation_queues)
+
+
+def get_invalidation_queue(create=False):
+    """Return the invalidation queue of the current transaction, ``None``
+    outside of a transaction, if ``PAGE_INVALIDATE_ON_COMMIT`` is
+    ``False`` or if Django has no ``transaction.on_commit``.
+
+    :param create: register a new queue if the transaction has none.
+    """
+    from pages import settings
+    if not settings.PAGE_INVALIDATE_ON_COMMIT or \
+            not hasattr(transaction, 'on_commit'):
+        return None
+    connection = transaction.get_connection()
+    queues = _queues.__dict__
+    if not connection.in_atomic_block:
+        # the transaction of the queue is over, what is left in it was
+        # rolled back
+        queues.pop(connection.alias, None)
+        return None
+    queue = queues.get(connection.alias)
+    if queue is None and create:
+        queue = queues[connection.alias] = InvalidationQueue()
+    return queue
+
+
+def invalidate_on_commit(flush, key=None, item=None):
+    """Call ``flush`` when the current transaction commits, once, with the
+    list of the items queued for it. Outside of a transaction it is
+    called right away.
+
+    Return ``True`` if the call was queued.
+
+    :param flush: a callable taking a list of items.
+    :param key: the key of the item, an item queued twice is flushed once.
+    :param item: the item to queue, if any.
+    """
+    queue = get_invalidation_queue(create=True)
+    if queue is None:
+        flush([] if key is None else [item])
+        return False
+    queue.add(flush, key, item)
+    return True
+
+
+def queued_invalidations(flush):
+    """Return the ``dict`` of the items queued for ``flush`` in the current
+    transaction, ``None`` if it isn't queued. Nothing read from the database
+    should be cached for them before the commit."""
+    queue = get_invalidation_queue()
+    if queue is None:
+        return None
+    return queue.flushes.get(flush)
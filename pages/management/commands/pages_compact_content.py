@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from pages.models import Content
+from pages import settings
+
+
+class Command(BaseCommand):
+    help = 'Delete the superseded contents of the pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+            help='number of superseded contents to keep for every page, '
+                 'language and placeholder, PAGE_CONTENT_HISTORY_LIMIT '
+                 'by default')
+        parser.add_argument('--batch-size', type=int, default=500,
+            help='maximum number of contents deleted in one query')
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        if limit is None:
+            limit = settings.PAGE_CONTENT_HISTORY_LIMIT
+        if limit is None or limit < 0:
+            raise CommandError('Give a non-negative --limit or set '
+                'PAGE_CONTENT_HISTORY_LIMIT')
+        deleted = Content.objects.compact_history(limit,
+            batch_size=options['batch_size'])
+        if options.get('verbosity', 1) > 0:
+            self.stdout.write('%d contents deleted' % deleted)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from pages.utils import get_placeholders_manifest
+
+import json
+
+
+class Command(BaseCommand):
+    help = ('Write a JSON manifest of the placeholders found in '
+        'the page templates')
+
+    def add_arguments(self, parser):
+        parser.add_argument('templates', nargs='*', type=str,
+            help='template names, all the page templates by default')
+        parser.add_argument('--filename', type=str, default=None,
+            help='file to write the manifest to, stdout by default')
+
+    def handle(self, *args, **options):
+        manifest = get_placeholders_manifest(options['templates'] or None)
+        data = json.dumps(manifest, indent=2, sort_keys=True)
+        if options['filename']:
+            with open(options['filename'], 'w') as f:
+                f.write(data)
+        else:
+            self.stdout.write(data)
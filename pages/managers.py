@@ -1,19 +1,63 @@
 # -*- coding: utf-8 -*-
 """Django page CMS ``managers``."""
 from pages import settings
-from pages.cache import cache
-from pages.utils import normalize_url, get_now
-from pages.phttp import get_slug
+from pages.cache import cache, invalidate_on_commit, queued_invalidations
+from pages.utils import normalize_url, get_now, reverse_page_path
+from pages.phttp import get_slug, remove_slug
 
+from django.apps import apps
 from django.db import models
 from django.db.models import Q
 from django.db.models import Avg, Max, Min, Count
 from django.conf import settings as global_settings
+from django.utils.encoding import force_bytes
 
 from mptt.managers import TreeManager
+from mptt.querysets import TreeQuerySet
 
+import hashlib
+import re
 
-class PageManager(TreeManager):
+
+class PageQuerySet(TreeQuerySet):
+    """
+    Page :class:`QuerySet` that can load the content of all its pages
+    in a single query.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PageQuerySet, self).__init__(*args, **kwargs)
+        self._content_prefetch = None
+
+    def prefetch_content(self, ctypes=None, languages=None):
+        """Return a new :class:`QuerySet` that will load the content of
+        every page with a single query when evaluated, and attach it
+        to the ``_content_dict`` of each page.
+
+        :param ctypes: the content types to load, all of them by default.
+        :param languages: the languages to load, all of them by default.
+        """
+        clone = self._clone()
+        clone._content_prefetch = (ctypes, languages)
+        return clone
+
+    def _clone(self, *args, **kwargs):
+        clone = super(PageQuerySet, self)._clone(*args, **kwargs)
+        clone._content_prefetch = self._content_prefetch
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is None
+        super(PageQuerySet, self)._fetch_all()
+        if fetched and self._content_prefetch is not None:
+            from pages.models import Content
+            ctypes, languages = self._content_prefetch
+            pages = [p for p in self._result_cache
+                if isinstance(p, self.model)]
+            Content.objects.prefetch_content(pages, ctypes, languages)
+
+
+class PageManager(TreeManager.from_queryset(PageQuerySet)):
     """
     Page manager provide several filters to obtain pages :class:`QuerySet`
     that respect the page attributes and project settings.
@@ -45,9 +89,11 @@ class PageManager(TreeManager):
         return self.on_site().filter(parent__isnull=True)
 
     def navigation(self):
-        """Creates a :class:`QuerySet` of the published root pages."""
+        """Creates a :class:`QuerySet` of the published root pages. The
+        titles of the pages are loaded with a single query."""
         return self.on_site().filter(
-            status=self.model.PUBLISHED).filter(parent__isnull=True)
+            status=self.model.PUBLISHED).filter(
+            parent__isnull=True).prefetch_content(ctypes=['title'])
 
     def hidden(self):
         """Creates a :class:`QuerySet` of the hidden pages."""
@@ -91,18 +137,18 @@ class PageManager(TreeManager):
         return self.on_site().filter(
             publication_end_date__lte=get_now())
 
-    def from_path(self, complete_path, lang, exclude_drafts=True):
-        """Return a :class:`Page <pages.models.Page>` according to
-        the page's path."""
-        from django.core.urlresolvers import reverse
-        if settings.PAGE_USE_LANGUAGE_PREFIX:
-            pages_root = reverse('pages-details-by-path', args=[settings.PAGE_DEFAULT_LANGUAGE, ''])
-        else:
-            pages_root = reverse('pages-details-by-path', args=[''])
+    def strip_path(self, complete_path):
+        """Return the path of a page without the pages root URL and the
+        leading and trailing slashes."""
+        pages_root = reverse_page_path('', settings.PAGE_DEFAULT_LANGUAGE)
         if complete_path.startswith(pages_root):
             complete_path = complete_path[len(pages_root) - 1:]
+        return complete_path.strip('/')
 
-        stripped = complete_path.strip('/')
+    def from_path(self, complete_path, lang, exclude_drafts=True):
+        """Return a :class:`Page <pages.models.Page>` according to
+        the page's path."""
+        stripped = self.strip_path(complete_path)
 
         # just return the root page
         if stripped == '':
@@ -117,17 +163,181 @@ class PageManager(TreeManager):
         except self.model.DoesNotExist:
             return None
 
+    PAGE_ROUTES_GENERATION_KEY = "page_routes_generation"
+    PAGE_ROUTE_KEY = "page_route_%d_%d_%s"
+
+    PAGE_FIRST_ROOT_KEY = "page_first_root_%d"
+
+    def get_site_key_id(self):
+        """Return the id of the current site for the cache keys, ``0`` if
+        the pages are not filtered by site."""
+        if settings.PAGE_USE_SITE_ID:
+            return global_settings.SITE_ID
+        return 0
+
+    def get_routes_generation(self, generation=None):
+        """Return the generation of the routes, it changes every time the
+        routes are invalidated.
+
+        :param generation: the generation when it has already been read.
+        """
+        if generation is None:
+            generation = cache.get(self.PAGE_ROUTES_GENERATION_KEY)
+        if generation is None:
+            generation = self.model.new_generation()
+            if not cache.add(self.PAGE_ROUTES_GENERATION_KEY, generation,
+                    None):
+                generation = cache.get(self.PAGE_ROUTES_GENERATION_KEY,
+                    generation)
+        return generation
+
+    def get_route_key(self, path):
+        """Return the cache key of the page of a path on the current site.
+        The key changes every time the routes are invalidated."""
+        # paths can contain spaces or be too long for memcache
+        digest = hashlib.sha1(force_bytes(path)).hexdigest()
+        return self.PAGE_ROUTE_KEY % (self.get_site_key_id(),
+            self.get_routes_generation(), digest)
+
+    def get_first_root_id(self):
+        """Return the id of the first root page of the current site,
+        ``None`` if there is no page.
+
+        It is cached with the generation of the routes, so it is read
+        with a single cache round trip and recomputed when a page is
+        saved, deleted or changes sites."""
+        key = self.PAGE_FIRST_ROOT_KEY % self.get_site_key_id()
+        cached = cache.get_many([self.PAGE_ROUTES_GENERATION_KEY, key])
+        generation = cached.get(self.PAGE_ROUTES_GENERATION_KEY)
+        entry = cached.get(key)
+        if generation is not None and entry is not None and \
+                entry[0] == generation:
+            return entry[1]
+        root_ids = list(self.root().values_list('id', flat=True)[:1])
+        first_root_id = root_ids[0] if root_ids else None
+        if queued_invalidations(self.retire_routes) is None:
+            generation = self.get_routes_generation(generation)
+            cache.set(key, (generation, first_root_id))
+        return first_root_id
+
+    def invalidate_routes(self):
+        """Retire all the cached routes at once, when the current transaction
+        commits. Called every time a page is saved or deleted, or its sites
+        change."""
+        invalidate_on_commit(self.retire_routes)
+
+    def retire_routes(self, items=()):
+        """Increment the generation of the routes, see
+        :meth:`invalidate_routes`."""
+        try:
+            cache.incr(self.PAGE_ROUTES_GENERATION_KEY)
+        except ValueError:
+            cache.set(self.PAGE_ROUTES_GENERATION_KEY,
+                self.model.new_generation(), None)
+
+    def resolve_path(self, complete_path, lang, exclude_drafts=True):
+        """Return the :class:`Page <pages.models.Page>` of the path or, if
+        there is none, the deepest page of the path that delegates to an
+        application.
+
+        All the candidate pages are fetched with a single query, however
+        deep the path is. The result, a page or the lack of page, is
+        cached until the routes are invalidated.
+        """
+        stripped = self.strip_path(complete_path)
+        key = self.get_route_key(stripped)
+        route = cache.get(key)
+        if route is not None:
+            if not route:
+                return None
+            field_names, values = route
+            return self.model.from_db(self.db, field_names, values)
+
+        page = self._resolve_path(stripped, lang, exclude_drafts)
+        if queued_invalidations(self.retire_routes) is not None:
+            # the routes change in the current transaction
+            return page
+        if page is None:
+            # absorb the floods of requests on missing pages
+            cache.set(key, 0, settings.PAGE_ROUTE_NOT_FOUND_TIMEOUT)
+        else:
+            field_names = [f.attname for f in self.model._meta.concrete_fields]
+            cache.set(key, (field_names,
+                [getattr(page, name) for name in field_names]))
+        return page
+
+    def _resolve_path(self, stripped, lang, exclude_drafts):
+        if stripped == '':
+            return self.from_path(stripped, lang, exclude_drafts)
+
+        max_length = self.model._meta.get_field('complete_slug').max_length
+        prefixes = []
+        path = stripped
+        while path is not None:
+            # longer paths can't match any page
+            if len(path) <= max_length:
+                prefixes.append(path)
+            path = remove_slug(path)
+        if not prefixes:
+            return None
+
+        pages = dict((page.complete_slug, page) for page in
+            self.on_site().filter(complete_slug__in=prefixes))
+        if stripped in pages:
+            return pages[stripped]
+        for path in prefixes:
+            page = pages.get(path)
+            if page is not None and page.delegate_to:
+                return page
+        return None
+
     def from_slug(self, slug):
         return self.on_site().filter(slug=slug)
 
     def from_complete_slug(self, complete_slug):
         return self.on_site().filter(complete_slug=complete_slug)
 
+    def with_complete_slug(self, complete_slug, exclude_id=None,
+            numbered=False):
+        """Return the other pages that use ``complete_slug``, or one of
+        its numbered variants (``complete_slug-1``, ``complete_slug-2``,
+        ...) if ``numbered`` is ``True``."""
+        if numbered:
+            # escape the special characters only, the escapes added by
+            # re.escape are not understood by every database
+            pattern = re.sub(r'([\\.^$|?*+()\[\]{}])', r'\\\1',
+                complete_slug)
+            pages = self.on_site().filter(
+                complete_slug__regex=r'^%s(-[0-9]+)?$' % pattern)
+        else:
+            pages = self.on_site().filter(complete_slug=complete_slug)
+        return pages.exclude(id=exclude_id)
+
+    def taken_complete_slugs(self, complete_slug, exclude_id=None):
+        """Return the set of complete slugs already used by other pages
+        among ``complete_slug`` and its numbered variants, with a single
+        query."""
+        return set(self.with_complete_slug(complete_slug, exclude_id,
+            numbered=True).values_list('complete_slug', flat=True))
+
+    def free_complete_slug(self, complete_slug, exclude_id=None):
+        """Return ``complete_slug`` if no other page uses it, otherwise
+        the first free numbered variant of it."""
+        taken = self.taken_complete_slugs(complete_slug, exclude_id)
+        free = complete_slug
+        next = 1
+        while free in taken:
+            free = '%s-%d' % (complete_slug, next)
+            next += 1
+        return free
+
 
 class ContentManager(models.Manager):
     """:class:`Content <pages.models.Content>` manager methods"""
 
-    PAGE_CONTENT_DICT_KEY = "page_content_dict_%d_%s_%d"
+    PAGE_CONTENT_DICT_KEY = "page_content_dict_%d_%d_%s_%d"
+    PAGE_STALE_CONTENT_DICT_KEY = "page_stale_content_dict_%d_%s_%d"
+    PAGE_CONTENT_LOCK_KEY = "page_content_lock_%d_%d"
 
     def save_content_if_changed(self, page, language, ctype, body):
         """Set or create a :class:`Content <pages.models.Content>` for a
@@ -140,7 +350,7 @@ class ContentManager(models.Manager):
         """
         try:
             content = self.filter(page=page, language=language,
-                                  type=ctype).latest('creation_date')
+                                  type=ctype, is_current=True).latest()
             if content.body == body:
                 return content
             content.body = body
@@ -160,10 +370,319 @@ class ContentManager(models.Manager):
         }
         if page.freeze_date and settings.PAGE_CONTENT_REVISION:
             from reversion.models import Version
-            content = self.get(**params)
+            content = self.filter(is_current=True, **params).latest()
             version = Version.objects.get_for_object(content).filter(revision__date_created__lte=page.freeze_date).last()
             return self.model(**version.field_dict)
-        return self.filter(**params).latest()
+        return self.filter(is_current=True, **params).latest()
+
+    def refresh_current(self, page, language, ctype):
+        """Mark the latest :class:`Content <pages.models.Content>` of a
+        particular page, language and placeholder type as the current one,
+        and unmark the older ones.
+
+        Return the primary key of the current content, ``None`` if there
+        is no content left.
+        """
+        contents = self.filter(page=page, language=language, type=ctype)
+        current = list(contents.order_by('-creation_date', '-pk').values_list(
+            'pk', flat=True)[:1])
+        contents.filter(is_current=True).exclude(pk__in=current).update(
+            is_current=False)
+        if not current:
+            return None
+        contents.filter(pk=current[0], is_current=False).update(
+            is_current=True)
+        return current[0]
+
+    def compact_history(self, limit=None, batch_size=500):
+        """Delete the superseded :class:`Content <pages.models.Content>`
+        of every page, language and placeholder type, keeping the current
+        content and the ``limit`` most recent ones before it.
+
+        Contents referenced by a revision, and the latest content created
+        before the ``freeze_date`` of its page, are always kept.
+
+        Return the number of deleted contents.
+
+        :param limit: the number of superseded contents to keep,
+            ``PAGE_CONTENT_HISTORY_LIMIT`` by default.
+        :param batch_size: the maximum number of pages scanned, and of
+            contents deleted, in a single query.
+        """
+        from pages.models import Page
+        if limit is None:
+            limit = settings.PAGE_CONTENT_HISTORY_LIMIT
+        if limit is None:
+            return 0
+
+        groups = self.values('page', 'language', 'type').annotate(
+            count=Count('pk')).filter(count__gt=limit + 1)
+        page_ids = sorted(set(group['page'] for group in groups))
+
+        deleted = 0
+        for i in range(0, len(page_ids), batch_size):
+            chunk = page_ids[i:i + batch_size]
+            freeze_dates = dict(Page.objects.filter(pk__in=chunk,
+                freeze_date__isnull=False).values_list('pk', 'freeze_date'))
+            rows = self.filter(page__in=chunk).order_by(
+                'page', 'language', 'type', '-creation_date', '-pk'
+            ).values_list('pk', 'page_id', 'language', 'type',
+                'creation_date', 'is_current')
+
+            superseded = []
+            group = None
+            for pk, page_id, language, ctype, date, is_current in rows:
+                if (page_id, language, ctype) != group:
+                    group = (page_id, language, ctype)
+                    position = 0
+                    freeze_date = freeze_dates.get(page_id)
+                else:
+                    position += 1
+                if freeze_date and date <= freeze_date:
+                    # the content displayed by the frozen page
+                    freeze_date = None
+                elif not is_current and position > limit:
+                    superseded.append(pk)
+
+            for j in range(0, len(superseded), batch_size):
+                pks = superseded[j:j + batch_size]
+                # versions recorded before PAGE_CONTENT_REVISION was
+                # turned off still need their content
+                if apps.is_installed('reversion'):
+                    from reversion.models import Version
+                    versioned = set(int(pk) for pk in
+                        Version.objects.get_for_model(self.model).filter(
+                            object_id__in=[str(pk) for pk in pks]
+                        ).values_list('object_id', flat=True))
+                    pks = [pk for pk in pks if pk not in versioned]
+                if pks:
+                    # delete() returns nothing on Django 1.8
+                    self.filter(pk__in=pks).delete()
+                    deleted += len(pks)
+        return deleted
+
+    def get_content_dict_key(self, page, ctype):
+        """Return the cache key of the ``{language: body}`` dict of a
+        particular page and placeholder type."""
+        frozen = int(bool(page.freeze_date))
+        key = self.PAGE_CONTENT_DICT_KEY % (
+            page.id, page.get_generation(), ctype, frozen)
+        # Spaces do not work with memcache
+        return key.replace(' ', '-')
+
+    def get_stale_content_dict_key(self, page, ctype):
+        """Return the cache key of the last ``{language: body}`` dict
+        built for a particular page and placeholder type, whatever the
+        generation of the page."""
+        frozen = int(bool(page.freeze_date))
+        key = self.PAGE_STALE_CONTENT_DICT_KEY % (page.id, ctype, frozen)
+        return key.replace(' ', '-')
+
+    def latest_for_pages(self, pages):
+        """Return a :class:`QuerySet` of the latest
+        :class:`Content <pages.models.Content>` of every language and
+        placeholder type of the given pages. Only the current contents are
+        read, however many historical rows exist."""
+        return self.filter(page__in=pages, is_current=True).order_by(
+            'creation_date', 'pk')
+
+    def frozen_for_pages(self, pages, ctypes=None, languages=None):
+        """Return the bodies displayed by the given pages at their
+        ``freeze_date``, in a ``dict`` keyed by (page id, type, language).
+
+        The revisions of every :class:`Content <pages.models.Content>` of
+        the pages are looked up at once, the latest one created before the
+        freeze date of its page wins and is the only one deserialized.
+        Without such a revision, the latest content created before the
+        freeze date is used. Only the winning bodies are loaded.
+
+        :param pages: a list of page objects with a ``freeze_date``.
+        :param ctypes: the content types to load, all of them by default.
+        :param languages: the languages to load, all of them by default.
+        """
+        from reversion.models import Version
+        freeze_dates = dict((page.id, page.freeze_date) for page in pages)
+        contents = self.filter(page__in=list(freeze_dates))
+        if ctypes is not None:
+            contents = contents.filter(type__in=ctypes)
+        if languages is not None:
+            contents = contents.filter(language__in=languages)
+
+        groups = {}
+        fallback = {}
+        for pk, page_id, ctype, language, date in contents.order_by(
+                'creation_date', 'pk').values_list('pk', 'page_id', 'type',
+                'language', 'creation_date'):
+            group = (page_id, ctype, language)
+            groups[str(pk)] = group
+            if date <= freeze_dates[page_id]:
+                fallback[group] = pk
+
+        latest = {}
+        object_ids = list(groups)
+        # stay below the SQL parameters limit of sqlite
+        for i in range(0, len(object_ids), 500):
+            versions = Version.objects.get_for_model(self.model).filter(
+                object_id__in=object_ids[i:i + 500],
+                revision__date_created__lte=max(freeze_dates.values()),
+            ).values_list('pk', 'object_id', 'revision__date_created')
+            for pk, object_id, date in versions:
+                group = groups[object_id]
+                if date > freeze_dates[group[0]]:
+                    continue
+                if group not in latest or (date, pk) > latest[group]:
+                    latest[group] = (date, pk)
+
+        bodies = {}
+        version_groups = dict((pk, group)
+            for group, (date, pk) in latest.items())
+        pks = list(version_groups)
+        for i in range(0, len(pks), 500):
+            for version in Version.objects.filter(pk__in=pks[i:i + 500]):
+                bodies[version_groups[version.pk]] = version.field_dict['body']
+
+        content_groups = dict((pk, group) for group, pk in fallback.items()
+            if group not in bodies)
+        pks = list(content_groups)
+        for i in range(0, len(pks), 500):
+            for pk, body in self.filter(pk__in=pks[i:i + 500]).values_list(
+                    'pk', 'body'):
+                bodies[content_groups[pk]] = body
+        return bodies
+
+    def _fill_content_dicts(self, pages, ctypes=None, languages=None,
+            required=()):
+        """Fetch the latest bodies of the given pages with a single query
+        per 500 pages and fill the ``_content_dict`` of each page. The bodies of frozen
+        pages are resolved through the revisions with a few more queries.
+        The cache entries are only written when every language has been
+        loaded, and never for the pages invalidated in the current
+        transaction.
+
+        Return a dict of the filled content dicts, keyed by cache key.
+        """
+        complete = languages is None
+        if complete:
+            languages = [lang[0] for lang in settings.PAGE_LANGUAGES]
+        bodies = dict((page.id, dict((ctype, {}) for ctype in required))
+            for page in pages)
+        if not bodies:
+            return {}
+
+        frozen = [page for page in pages
+            if page.freeze_date and settings.PAGE_CONTENT_REVISION]
+        frozen_ids = set(page.id for page in frozen)
+        live = [page_id for page_id in bodies if page_id not in frozen_ids]
+        # stay below the SQL parameters limit of sqlite
+        for i in range(0, len(live), 500):
+            rows = self.latest_for_pages(live[i:i + 500])
+            if ctypes is not None:
+                rows = rows.filter(type__in=ctypes)
+            if not complete:
+                rows = rows.filter(language__in=languages)
+            # rows are ordered by date, the last one wins on a tie
+            for page_id, ctype, language, body in rows.values_list(
+                    'page_id', 'type', 'language', 'body'):
+                bodies[page_id].setdefault(ctype, {})[language] = body
+        if frozen:
+            frozen_bodies = self.frozen_for_pages(frozen, ctypes,
+                None if complete else languages)
+            for (page_id, ctype, language), body in frozen_bodies.items():
+                bodies[page_id].setdefault(ctype, {})[language] = body
+
+        from pages.models import Page
+        queued = queued_invalidations(Page.invalidate_pages) or {}
+        content_dicts = {}
+        cached_dicts = {}
+        for page in pages:
+            if page._content_dict is None:
+                page._content_dict = dict()
+            page_ctypes = set(bodies[page.id]) | set(ctypes or ())
+            for ctype in page_ctypes:
+                by_language = bodies[page.id].get(ctype, {})
+                key = self.get_content_dict_key(page, ctype)
+                content_dicts[key] = page._content_dict[key] = dict(
+                    (lang, by_language.get(lang, '')) for lang in languages)
+                if page.id in queued:
+                    # the stale key has no generation, the uncommitted
+                    # contents would outlive the transaction
+                    continue
+                cached_dicts[key] = content_dicts[key]
+                if settings.PAGE_CONTENT_REBUILD_LOCK_TIMEOUT:
+                    stale_key = self.get_stale_content_dict_key(page, ctype)
+                    cached_dicts[stale_key] = content_dicts[key]
+
+        if complete and cached_dicts:
+            cache.set_many(cached_dicts)
+        return content_dicts
+
+    def load_content_dicts(self, page, ctypes=()):
+        """Fetch the latest body of every (type, language) pair of the page
+        with a single query, then fill ``page._content_dict`` and the cache
+        entries of all the placeholders at once.
+
+        :param page: the concerned page object.
+        :param ctypes: content types that should be filled even if no
+            content exists for them yet.
+        """
+        return self._fill_content_dicts([page], required=ctypes)
+
+    def rebuild_content_dict(self, page, ctype):
+        """Load the content dicts of a page after a cache miss and return
+        the one of the given placeholder type.
+
+        Only one process rebuilds the content of a page at a time, the
+        others are served the dict built before the last invalidation
+        until the rebuild is over, or the lock expires.
+
+        :param page: the concerned page object.
+        :param ctype: the content type.
+        """
+        key = self.get_content_dict_key(page, ctype)
+        timeout = settings.PAGE_CONTENT_REBUILD_LOCK_TIMEOUT
+        if not timeout:
+            return self.load_content_dicts(page, [ctype])[key]
+        lock = self.PAGE_CONTENT_LOCK_KEY % (page.id, page.get_generation())
+        if cache.add(lock, 1, timeout):
+            try:
+                return self.load_content_dicts(page, [ctype])[key]
+            finally:
+                cache.delete(lock)
+        stale = cache.get(self.get_stale_content_dict_key(page, ctype))
+        if stale is None:
+            return self.load_content_dicts(page, [ctype])[key]
+        if page._content_dict is None:
+            page._content_dict = dict()
+        page._content_dict[key] = stale
+        return stale
+
+    def prefetch_content(self, pages, ctypes=None, languages=None):
+        """Load the content of many pages at once and attach it to the
+        ``_content_dict`` of each page. Content already in the cache is
+        used when possible, the rest is loaded with a single query.
+
+        :param pages: a list of page objects.
+        :param ctypes: the content types to load, all of them by default.
+        :param languages: the languages to load, all of them by default.
+        """
+        from pages.models import Page
+        Page.load_generations(pages)
+        if ctypes is not None and languages is None:
+            keys = dict((page.id, [self.get_content_dict_key(page, ctype)
+                for ctype in ctypes]) for page in pages)
+            cached = cache.get_many(
+                [key for page_keys in keys.values() for key in page_keys])
+            missing = []
+            for page in pages:
+                if all(key in cached for key in keys[page.id]):
+                    if page._content_dict is None:
+                        page._content_dict = dict()
+                    for key in keys[page.id]:
+                        page._content_dict[key] = cached[key]
+                else:
+                    missing.append(page)
+            pages = missing
+        self._fill_content_dicts(pages, ctypes, languages)
 
     def get_content(self, page, language, ctype, language_fallback=False):
         """Gets the latest content string for a particular page, language and
@@ -179,33 +698,23 @@ class ContentManager(models.Manager):
         if not language:
             language = settings.PAGE_DEFAULT_LANGUAGE
 
-        frozen = int(bool(page.freeze_date))
-        key = self.PAGE_CONTENT_DICT_KEY % (page.id, ctype, frozen)
-
-        # Spaces do not work with memcache
-        key = key.replace(' ', '-')
+        key = self.get_content_dict_key(page, ctype)
 
         if page._content_dict is None:
             page._content_dict = dict()
-        if page._content_dict.get(key, None):
-            content_dict = page._content_dict.get(key)
-        else:
+        content_dict = page._content_dict.get(key, None)
+        # content prefetched for some languages only
+        if (content_dict and not content_dict.get(language) and
+                len(content_dict) < len(settings.PAGE_LANGUAGES)):
+            content_dict = None
+        if not content_dict:
             content_dict = cache.get(key)
 
-        # fill a dict object for each language, that will create
-        # P * L queries.
-        # L == number of language, P == number of placeholder in the page.
-        # Once generated the result is cached.
         if not content_dict:
-            content_dict = {}
-            for lang in settings.PAGE_LANGUAGES:
-                try:
-                    content = self.get_content_object(page, lang[0], ctype)
-                    content_dict[lang[0]] = content.body
-                except self.model.DoesNotExist:
-                    content_dict[lang[0]] = ''
-            page._content_dict[key] = content_dict
-            cache.set(key, content_dict)
+            # every placeholder of the page is loaded at once and the
+            # result is cached, frozen pages are resolved through the
+            # revisions.
+            content_dict = self.rebuild_content_dict(page, ctype)
 
         if language in content_dict and content_dict[language]:
             return content_dict[language]
@@ -217,9 +726,51 @@ class ContentManager(models.Manager):
         return ''
 
 
+# process level copy of the aliases: (version, {url: (alias id, page id)})
+_alias_map = (None, {})
+
+
 class PageAliasManager(models.Manager):
     """:class:`PageAlias <pages.models.PageAlias>` manager."""
 
+    PAGE_ALIASES_VERSION_KEY = "page_aliases_version"
+
+    def get_alias_map(self):
+        """Return a ``dict`` of every alias URL to the alias and page ids.
+
+        The map is loaded once by every process and reloaded when its
+        version, stored in the pages cache, changes."""
+        global _alias_map
+        from pages.models import Page
+        version = cache.get(self.PAGE_ALIASES_VERSION_KEY)
+        if version is None:
+            version = Page.new_generation()
+            if not cache.add(self.PAGE_ALIASES_VERSION_KEY, version, None):
+                version = cache.get(self.PAGE_ALIASES_VERSION_KEY, version)
+        loaded_version, urls = _alias_map
+        if loaded_version != version:
+            urls = dict((url, (pk, page_id)) for url, pk, page_id in
+                self.values_list('url', 'pk', 'page_id'))
+            if queued_invalidations(self.retire_alias_map) is None:
+                _alias_map = (version, urls)
+        return urls
+
+    def invalidate_alias_map(self):
+        """Make every process reload the aliases, when the current
+        transaction commits. Called every time an alias is saved or
+        deleted."""
+        invalidate_on_commit(self.retire_alias_map)
+
+    def retire_alias_map(self, items=()):
+        """Increment the version of the aliases, see
+        :meth:`invalidate_alias_map`."""
+        from pages.models import Page
+        try:
+            cache.incr(self.PAGE_ALIASES_VERSION_KEY)
+        except ValueError:
+            cache.set(self.PAGE_ALIASES_VERSION_KEY, Page.new_generation(),
+                None)
+
     def from_path(self, request, path, lang):
         """
         Resolve a request to an alias. returns a
@@ -228,28 +779,24 @@ class PageAliasManager(models.Manager):
         aliases (``/foo/bar``) as well as aliases containing GET parameters
         (like ``index.php?page=foo``).
 
+        The aliases are looked up in the map of :meth:`get_alias_map`,
+        without any query.
+
         :param request: the request object
         :param path: the complete path to the page
         :param lang: not used
         """
-        from pages.models import PageAlias
-
+        urls = self.get_alias_map()
         url = normalize_url(path)
+        candidates = [url]
         # §1: try with complete query string
         query = request.META.get('QUERY_STRING')
         if query:
-            url = url + '?' + query
-        try:
-            alias = PageAlias.objects.get(url=url)
-            return alias
-        except PageAlias.DoesNotExist:
-            pass
+            candidates.insert(0, url + '?' + query)
         # §2: try with path only
-        url = normalize_url(path)
-        try:
-            alias = PageAlias.objects.get(url=url)
-            return alias
-        except PageAlias.DoesNotExist:
-            pass
+        for candidate in candidates:
+            if candidate in urls:
+                pk, page_id = urls[candidate]
+                return self.model(pk=pk, url=candidate, page_id=page_id)
         # §3: not alias found, we give up
         return None
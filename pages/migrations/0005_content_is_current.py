@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def mark_current_contents(apps, schema_editor):
+    """Mark the latest content of every (page, language, type) as current."""
+    Content = apps.get_model('pages', 'Content')
+    current = {}
+    rows = Content.objects.order_by('creation_date', 'pk').values_list(
+        'pk', 'page_id', 'language', 'type')
+    for pk, page_id, language, ctype in rows.iterator():
+        current[(page_id, language, ctype)] = pk
+    pks = list(current.values())
+    # stay below the SQL parameters limit of sqlite
+    for i in range(0, len(pks), 500):
+        Content.objects.filter(pk__in=pks[i:i + 500]).update(is_current=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0004_page_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='is_current',
+            field=models.BooleanField(default=False, editable=False, verbose_name='current'),
+        ),
+        migrations.AlterIndexTogether(
+            name='content',
+            index_together=set([('page', 'language', 'type', 'creation_date'), ('page', 'language', 'type', 'is_current')]),
+        ),
+        migrations.RunPython(mark_current_contents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def fill_effective_templates(apps, schema_editor):
+    """Compute the effective template of every page from its ancestors."""
+    Page = apps.get_model('pages', 'Page')
+    effective = {}
+    rows = Page.objects.order_by('tree_id', 'lft').values_list(
+        'pk', 'parent_id', 'template')
+    for pk, parent_id, template in rows.iterator():
+        effective[pk] = template or effective.get(parent_id, '')
+    by_template = {}
+    for pk, template in effective.items():
+        if template:
+            by_template.setdefault(template, []).append(pk)
+    for template, pks in by_template.items():
+        # stay below the SQL parameters limit of sqlite
+        for i in range(0, len(pks), 500):
+            Page.objects.filter(pk__in=pks[i:i + 500]).update(
+                effective_template=template)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0005_content_is_current'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='effective_template',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100, verbose_name='effective template'),
+        ),
+        migrations.RunPython(fill_effective_templates, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 """Django page CMS ``models``."""
-from pages.cache import cache
+from pages.cache import cache, invalidate_on_commit, queued_invalidations
 from pages.utils import get_placeholders, normalize_url, get_now
+from pages.utils import get_url_prefixes, reverse_page_path
 from pages.managers import PageManager, ContentManager
 from pages.managers import PageAliasManager
 from pages import settings
@@ -8,15 +9,18 @@ from pages import settings
 from pages import checks
 
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_delete, post_save, m2m_changed
 from django.conf import settings as django_settings
 from django.utils.translation import ugettext_lazy as _
 from django.utils.safestring import mark_safe
-from django.core.urlresolvers import reverse
 from django.conf import settings as global_settings
 from django.utils.encoding import python_2_unicode_compatible
 
 
 from mptt.models import MPTTModel
+import time
 import uuid
 
 PAGE_CONTENT_DICT_KEY = ContentManager.PAGE_CONTENT_DICT_KEY
@@ -51,6 +55,10 @@ class Page(MPTTModel):
 
     .. attribute:: template
        A string containing the name of the template file for this page.
+
+    .. attribute:: effective_template
+       The template of this page or of its closest ancestor that has one,
+       maintained on save and move.
     """
 
     # some class constants to refer to, e.g. Page.DRAFT
@@ -64,11 +72,8 @@ class Page(MPTTModel):
         (DRAFT, _('Draft')),
     )
 
-    PAGE_LANGUAGES_KEY = "page_%d_languages"
-    PAGE_URL_KEY = "page_%d_url"
-    ANCESTORS_KEY = 'ancestors_%d'
-    CHILDREN_KEY = 'children_%d'
-    PUB_CHILDREN_KEY = 'pub_children_%d'
+    PAGE_GENERATION_KEY = "page_%d_generation"
+    PAGE_LANGUAGES_KEY = "page_%d_%d_languages"
 
     # used to identify pages across different databases
     uuid = models.UUIDField(default=uuid.uuid4, editable=False)
@@ -92,6 +97,8 @@ class Page(MPTTModel):
     status = models.IntegerField(_('status'), choices=STATUSES, default=DRAFT)
     template = models.CharField(_('template'), max_length=100, null=True,
             blank=True)
+    effective_template = models.CharField(_('effective template'),
+            max_length=100, blank=True, default='', editable=False)
 
     delegate_to = models.CharField(_('delegate to'), max_length=100, null=True,
             blank=True)
@@ -134,10 +141,13 @@ class Page(MPTTModel):
         # per instance cache
         self._languages = None
         self._content_dict = None
+        self._generation = None
         self._is_first_root = None
         self._complete_slug = None
+        self._url_paths = {}
         super(Page, self).__init__(*args, **kwargs)
         self._original_complete_slug = self.complete_slug
+        self._original_effective_template = self.effective_template
         self.override_url = None
 
     @staticmethod
@@ -155,8 +165,8 @@ class Page(MPTTModel):
     def save(self, *args, **kwargs):
         """
             Overridden save method which updates the ``complete_slug`` attribute of
-            this page and all subpages. Quite expensive when called with a page
-            high up in the tree.
+            this page and all subpages. The subpages are updated with a single
+            query.
         """
         if not self.status:
             self.status = self.DRAFT
@@ -177,33 +187,56 @@ class Page(MPTTModel):
             self.sites.add(Site.objects.get(pk=global_settings.SITE_ID))
 
         # If slug already exists in database (on move for example)
-        # we will make our slug unquie by appending timestamp to the end
-        next = 1
-        self.complete_slug = self.build_complete_slug(self.parent, self.slug)
-        while Page.objects.from_complete_slug(self.complete_slug).exclude(id=self.id).exists():
-            self.complete_slug = self.build_complete_slug(self.parent, self.slug) + '-' + str(next)
-            next += 1
+        # we will make our slug unique by appending a number to the end
+        self.complete_slug = Page.objects.free_complete_slug(
+            self.build_complete_slug(self.parent, self.slug), self.id)
+
+        self.effective_template = self.template or (
+            self.parent.effective_template if self.parent_id else '')
 
         super(Page, self).save(*args, **kwargs)
+        self._url_paths = {}
+
+        if self.effective_template != self._original_effective_template:
+            self._original_effective_template = self.effective_template
+            self.update_descendants_template()
 
         # If our cached URL changed we need to update all descendants to
         # reflect the changes. Since this is a very expensive operation
         # on large sites we'll check whether our complete_slug actually changed
         # or if the updates weren't navigation related:
-        if self.complete_slug == self._original_complete_slug:
-            return
+        old_complete_slug = self._original_complete_slug
+        self._original_complete_slug = self.complete_slug
+        if self.complete_slug != old_complete_slug and old_complete_slug:
+            self.update_descendants_complete_slug(old_complete_slug)
 
-        pages = self.get_descendants().order_by('lft')
+        # the cached routes are retired once the descendants are up to
+        # date, a route resolved before would cache their old values
+        Page.objects.invalidate_routes()
 
-        for page in pages:
-            if page.override_url:
-                page.complete_slug = page.override_url
-            else:
-                page.complete_slug = page.build_complete_slug(page.parent, page.slug)
+    save.alters_data = True
 
+    def update_descendants_complete_slug(self, old_complete_slug):
+        """Replace the ``old_complete_slug`` prefix of the complete slug of
+        the descendants of this page by its current complete slug.
+
+        The descendants are rewritten in a single UPDATE, only those whose
+        complete slug did not start with the old prefix are rebuilt one
+        by one."""
+        descendants = Page.objects.filter(tree_id=self.tree_id,
+            lft__gt=self.lft, rght__lt=self.rght)
+        old_prefix = old_complete_slug + '/'
+        descendants.filter(complete_slug__startswith=old_prefix).update(
+            complete_slug=Concat(Value(self.complete_slug + '/'),
+                Substr('complete_slug', len(old_prefix) + 1)))
+
+        # parents first
+        pages = descendants.exclude(
+            complete_slug__startswith=self.complete_slug + '/')
+        for page in pages.order_by('lft'):
+            page.complete_slug = page.build_complete_slug(page.parent, page.slug)
             super(Page, page).save()  # do not recurse
-
-    save.alters_data = True
+    update_descendants_complete_slug.alters_data = True
 
     def _get_calculated_status(self):
         """Get the calculated status of the page based on
@@ -226,32 +259,19 @@ class Page(MPTTModel):
         return self.calculated_status in (self.PUBLISHED, self.HIDDEN)
     visible = property(_visible)
 
-    def get_children(self):
-        """Cache superclass result"""
-        key = self.CHILDREN_KEY % self.id
-        #children = cache.get(key, None)
-        # if children is None:
-        children = super(Page, self).get_children()
-        #cache.set(key, children)
-        return children
-
     def published_children(self):
         """Return a :class:`QuerySet` of published children page"""
-        key = self.PUB_CHILDREN_KEY % self.id
-        #children = cache.get(key, None)
-        # if children is None:
-        children = Page.objects.filter_published(self.get_children()).all()
-        #cache.set(key, children)
-        return children
+        return Page.objects.filter_published(self.get_children()).all()
 
     def get_children_for_frontend(self):
-        """Return a :class:`QuerySet` of published children page"""
-        return self.published_children()
+        """Return a :class:`QuerySet` of published children page. The
+        titles of the children are loaded with a single query."""
+        return self.published_children().prefetch_content(ctypes=['title'])
 
     def get_date_ordered_children_for_frontend(self):
         """Return a :class:`QuerySet` of published children page ordered
         by publication date."""
-        return self.published_children().order_by('-publication_date')
+        return self.get_children_for_frontend().order_by('-publication_date')
 
     def move_to(self, target, position='first-child'):
         """Invalidate cache when moving"""
@@ -263,35 +283,83 @@ class Page(MPTTModel):
         super(Page, self).move_to(target, position=position)
         self.save()
 
+    @staticmethod
+    def new_generation():
+        """Return a generation number that has never been used, so keys
+        of an evicted generation counter can't be read again."""
+        return int(time.time() * 1000)
+
+    def get_generation(self):
+        """Return the generation number of this page. It is part of every
+        content and languages cache key of the page."""
+        if self._generation is not None:
+            return self._generation
+        key = self.PAGE_GENERATION_KEY % self.id
+        generation = cache.get(key)
+        if generation is None:
+            generation = self.new_generation()
+            if not cache.add(key, generation, None):
+                generation = cache.get(key, generation)
+        self._generation = generation
+        return generation
+
+    @classmethod
+    def load_generations(cls, pages):
+        """Load the generation numbers of many pages at once."""
+        pages = [page for page in pages if page._generation is None]
+        keys = dict((cls.PAGE_GENERATION_KEY % page.id, page)
+            for page in pages)
+        if not keys:
+            return
+        generations = cache.get_many(list(keys.keys()))
+        missing = {}
+        for key, page in keys.items():
+            if key not in generations:
+                missing[key] = cls.new_generation()
+            page._generation = generations.get(key, missing.get(key))
+        if missing:
+            cache.set_many(missing, None)
+
     def invalidate(self):
-        """Invalidate cached data for this page."""
-
-        cache.delete(self.PAGE_LANGUAGES_KEY % (self.id))
-        cache.delete('PAGE_FIRST_ROOT_ID')
-        cache.delete(self.CHILDREN_KEY % self.id)
-        cache.delete(self.PUB_CHILDREN_KEY % self.id)
-        # XXX: Should this have a depth limit?
-        if self.parent_id:
-            self.parent.invalidate()
+        """Invalidate cached data for this page.
+
+        Inside a transaction the page is only queued, every queued page
+        is invalidated once when the transaction commits, see
+        :meth:`invalidate_pages <Page.invalidate_pages>`, and forgotten
+        if it rolls back. Until then this instance uses a generation of
+        its own, so it doesn't read the keys that are about to be retired,
+        and the contents of the page are not cached, so other readers don't
+        see its uncommitted state. Set
+        :data:`pages.settings.PAGE_INVALIDATE_ON_COMMIT` to ``False`` to
+        invalidate immediately."""
         self._languages = None
         self._complete_slug = None
+        self._is_first_root = None
+        self._url_paths = {}
         self._content_dict = dict()
-
-        p_names = [p.ctype for p in get_placeholders(self.get_template())]
-        if 'slug' not in p_names:
-            p_names.append('slug')
-        if 'title' not in p_names:
-            p_names.append('title')
-        # delete content cache, frozen or not
-        for name in p_names:
-            # frozen
-            cache.delete(PAGE_CONTENT_DICT_KEY %
-                (self.id, name, 1))
-            # not frozen
-            cache.delete(PAGE_CONTENT_DICT_KEY %
-                (self.id, name, 0))
-
-        cache.delete(self.PAGE_URL_KEY % (self.id))
+        self._generation = None
+        if invalidate_on_commit(Page.invalidate_pages, self.id, self):
+            self._generation = self.new_generation()
+
+    @classmethod
+    def invalidate_pages(cls, pages):
+        """Invalidate cached data for many pages.
+
+        The generation of every page is incremented, which retires all the
+        content and languages keys of the page at once: no key needs
+        to be enumerated and stale entries expire on their own. The
+        ancestors are left alone: nothing cached for them depends on their
+        descendants."""
+        for page in pages:
+            # deleted pages have no id left
+            if page.id is None:
+                continue
+            page._generation = None
+            key = cls.PAGE_GENERATION_KEY % page.id
+            try:
+                page._generation = cache.incr(key)
+            except ValueError:
+                cache.set(key, cls.new_generation(), None)
 
     def get_languages(self):
         """
@@ -299,7 +367,8 @@ class Page(MPTTModel):
         """
         if self._languages:
             return self._languages
-        self._languages = cache.get(self.PAGE_LANGUAGES_KEY % (self.id))
+        key = self.PAGE_LANGUAGES_KEY % (self.id, self.get_generation())
+        self._languages = cache.get(key)
         if self._languages is not None:
             return self._languages
 
@@ -307,33 +376,20 @@ class Page(MPTTModel):
             c in Content.objects.filter(page=self).values('language')]
         # remove duplicates
         languages = sorted(set(languages))
-        cache.set(self.PAGE_LANGUAGES_KEY % (self.id), languages)
+        queued = queued_invalidations(Page.invalidate_pages) or {}
+        if self.id not in queued:
+            # the languages of a queued page are not committed yet
+            cache.set(key, languages)
         self._languages = languages
         return languages
 
     def is_first_root(self):
         """Return ``True`` if this page is the first root pages."""
-        parent_cache_key = 'PARENT_FOR_%d' % self.id
-        has_parent = cache.get(parent_cache_key, None)
-        if has_parent is None:
-            has_parent = not not self.parent
-            cache.set(parent_cache_key, has_parent)
-
-        if has_parent:
+        if self.parent_id is not None:
             return False
-        if self._is_first_root is not None:
-            return self._is_first_root
-        first_root_id = cache.get('PAGE_FIRST_ROOT_ID')
-        if first_root_id is not None:
-            self._is_first_root = first_root_id == self.id
-            return self._is_first_root
-        try:
-            first_root_id = Page.objects.root().values('id')[0]['id']
-        except IndexError:
-            first_root_id = None
-        if first_root_id is not None:
-            cache.set('PAGE_FIRST_ROOT_ID', first_root_id)
-        self._is_first_root = self.id == first_root_id
+        if self._is_first_root is None:
+            self._is_first_root = \
+                Page.objects.get_first_root_id() == self.id
         return self._is_first_root
 
     def get_template(self):
@@ -342,19 +398,39 @@ class Page(MPTTModel):
         defined or the closer parent's one if defined
         or :attr:`pages.settings.PAGE_DEFAULT_TEMPLATE` otherwise.
         """
-        if self.template:
-            return self.template
-
-        template = None
-        for p in self.get_ancestors(ascending=True):
-            if p.template:
-                template = p.template
-                break
-
-        if not template:
-            template = settings.PAGE_DEFAULT_TEMPLATE
-
-        return template
+        return (self.template or self.effective_template or
+            settings.PAGE_DEFAULT_TEMPLATE)
+
+    def update_descendants_template(self):
+        """Copy the :attr:`effective_template <Page.effective_template>`
+        of this page to the descendants that inherit it.
+
+        Descendants with their own template, and their subtrees, are
+        skipped: the remaining ``lft`` ranges are updated in a few
+        set-based queries."""
+        descendants = Page.objects.filter(tree_id=self.tree_id,
+            lft__gt=self.lft, rght__lt=self.rght)
+        templated = descendants.exclude(template__isnull=True).exclude(
+            template='').order_by('lft').values_list('lft', 'rght')
+        ranges = []
+        start = self.lft
+        for lft, rght in templated:
+            # nested in a subtree that is already skipped
+            if lft < start:
+                continue
+            if lft > start + 1:
+                ranges.append(models.Q(lft__gt=start, lft__lt=lft))
+            start = rght
+        if self.rght > start + 1:
+            ranges.append(models.Q(lft__gt=start, lft__lt=self.rght))
+        # keep the number of conditions of each query reasonable
+        for i in range(0, len(ranges), 100):
+            condition = ranges[i]
+            for q in ranges[i + 1:i + 100]:
+                condition |= q
+            descendants.filter(condition).update(
+                effective_template=self.effective_template)
+    update_descendants_template.alters_data = True
 
     def get_template_name(self):
         """
@@ -373,12 +449,10 @@ class Page(MPTTModel):
         """Return a :class:`QuerySet` of valid targets for moving a page
         into the tree.
 
-        :param perms: the level of permission of the concerned user.
+        The page and its descendants are excluded by their tree range.
         """
-        exclude_list = [self.id]
-        for p in self.get_descendants():
-            exclude_list.append(p.id)
-        return Page.objects.exclude(id__in=exclude_list)
+        return Page.objects.exclude(tree_id=self.tree_id,
+            lft__gte=self.lft, rght__lte=self.rght)
 
     # Content methods
 
@@ -437,21 +511,24 @@ class Page(MPTTModel):
 
         :param language: the wanted url language.
         """
-        if self.is_first_root():
-            # this is used to allow users to change URL of the root
-            # page. The language prefix is not usable here.
-            try:
-                return reverse('pages-root')
-            except Exception:
-                pass
-        url = self.get_complete_slug(language)
         if not language:
             language = settings.PAGE_DEFAULT_LANGUAGE
-        if settings.PAGE_USE_LANGUAGE_PREFIX:
-            return reverse('pages-details-by-path',
-                args=[language, url])
+        # the reverse prefixes are computed once for each URLconf and
+        # the path of the page once for each of them.
+        prefixes = get_url_prefixes(language)
+        key = (language, ) + prefixes
+        if key in self._url_paths:
+            return self._url_paths[key]
+        root_url = prefixes[0]
+        if root_url is not None and self.is_first_root():
+            # this is used to allow users to change URL of the root
+            # page. The language prefix is not usable here.
+            path = root_url
         else:
-            return reverse('pages-details-by-path', args=[url])
+            path = reverse_page_path(self.get_complete_slug(language),
+                language)
+        self._url_paths[key] = path
+        return path
 
     def get_absolute_url(self, language=None):
         """Alias for `get_url_path`.
@@ -519,12 +596,36 @@ class Content(models.Model):
 
     creation_date = models.DateTimeField(_('creation date'), editable=False,
         default=get_now)
+    # maintained by save and delete, and by a signal for the raw saves of
+    # loaddata, only the latest content of a (page, language, type) is
+    # marked as current. Writers that skip the signals, like bulk_create,
+    # must call ContentManager.refresh_current.
+    is_current = models.BooleanField(_('current'), default=False,
+        editable=False)
     objects = ContentManager()
 
     class Meta:
         get_latest_by = 'creation_date'
         verbose_name = _('content')
         verbose_name_plural = _('contents')
+        index_together = [
+            ('page', 'language', 'type', 'creation_date'),
+            ('page', 'language', 'type', 'is_current'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Save the content and update the current content marker of its
+        page, language and placeholder type."""
+        super(Content, self).save(*args, **kwargs)
+        current = Content.objects.refresh_current(
+            self.page_id, self.language, self.type)
+        self.is_current = current == self.pk
+
+    def delete(self, *args, **kwargs):
+        """Delete the content, the previous one becomes current."""
+        super(Content, self).delete(*args, **kwargs)
+        Content.objects.refresh_current(
+            self.page_id, self.language, self.type)
 
     def __str__(self):
         return u"{0} :: {1}".format(self.page.slug, self.body[0:15])
@@ -547,6 +648,55 @@ class PageAlias(models.Model):
         # normalize url
         self.url = normalize_url(self.url)
         super(PageAlias, self).save(*args, **kwargs)
+        PageAlias.objects.invalidate_alias_map()
 
     def __str__(self):
         return "{0} :: {1}".format(self.url, self.page.get_complete_slug())
+
+
+def invalidate_routes(sender, **kwargs):
+    """Retire the cached routes when a page is deleted or when the sites
+    of a page change."""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        Page.objects.invalidate_routes()
+post_delete.connect(invalidate_routes, sender=Page)
+m2m_changed.connect(invalidate_routes, sender=Page.sites.through)
+
+
+def invalidate_alias_map(sender, **kwargs):
+    """Make every process reload the aliases when one is deleted."""
+    PageAlias.objects.invalidate_alias_map()
+post_delete.connect(invalidate_alias_map, sender=PageAlias)
+
+
+def refresh_effective_template(sender, instance, raw=False, using=None,
+        **kwargs):
+    """Set the effective template of the pages loaded by ``loaddata``, and
+    of their descendants already loaded: raw saves don't go through
+    :meth:`Page.save`."""
+    if not raw:
+        return
+    pages = Page.objects.db_manager(using)
+    effective = instance.template or ''
+    if not effective:
+        # the ancestors that are not loaded yet update this page later
+        templates = pages.filter(tree_id=instance.tree_id,
+            lft__lt=instance.lft, rght__gt=instance.rght).exclude(
+            template__isnull=True).exclude(template='').order_by(
+            '-lft').values_list('template', flat=True)[:1]
+        effective = templates[0] if templates else ''
+    instance.effective_template = effective
+    instance._original_effective_template = effective
+    pages.filter(pk=instance.pk).update(effective_template=effective)
+    instance.update_descendants_template()
+post_save.connect(refresh_effective_template, sender=Page)
+
+
+def refresh_current_content(sender, instance, raw=False, using=None,
+        **kwargs):
+    """Mark the current contents loaded by ``loaddata``, raw saves don't
+    go through :meth:`Content.save`."""
+    if raw:
+        Content.objects.db_manager(using).refresh_current(
+            instance.page_id, instance.language, instance.type)
+post_save.connect(refresh_current_content, sender=Content)
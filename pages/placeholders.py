@@ -4,6 +4,7 @@ from pages import settings
 from pages.models import Content
 from pages.widgets import ImageInput, FileInput
 from pages.utils import slugify
+from pages.cache import cache, LRUCache
 
 from django import forms
 from django.core.mail import send_mail
@@ -19,6 +20,9 @@ from django.utils.text import unescape_string_literal
 from django.template.loader import render_to_string
 from django.template import RequestContext
 from django.core.files.uploadedfile import UploadedFile
+from django.core.signals import setting_changed
+from django.utils.encoding import force_bytes
+import hashlib
 import logging
 import os
 import time
@@ -29,6 +33,44 @@ logger = logging.getLogger("pages")
 
 PLACEHOLDER_ERROR = _("[Placeholder %(name)s had syntax error: %(error)s]")
 
+# compiled templates of the parsed placeholders, shared by the requests
+# of the process
+parsed_templates = LRUCache(settings.PAGE_PARSED_TEMPLATE_CACHE_SIZE)
+
+# HTML of the markdown placeholders, in front of the pages cache
+rendered_markdown = LRUCache(settings.PAGE_MARKDOWN_CACHE_SIZE)
+
+# decoded objects of the JSON placeholders
+decoded_json = LRUCache(settings.PAGE_JSON_CACHE_SIZE)
+
+# markers of the decoded_json cache, for a content that has not been
+# decoded yet and for a content that is not valid JSON
+JSON_NOT_DECODED = object()
+JSON_DECODE_ERROR = object()
+
+
+def clear_parsed_templates(setting=None, **kwargs):
+    """Empty the compiled templates cache when the template engines
+    configuration changes."""
+    if setting is None or setting == 'TEMPLATES':
+        parsed_templates.clear()
+setting_changed.connect(clear_parsed_templates)
+
+
+def get_parsed_template(content, name):
+    """Return the compiled template of a placeholder content, compiling
+    it only if the same content has not been seen before.
+
+    :param content: the template source.
+    :param name: the name of the placeholder.
+    """
+    key = (name, hashlib.sha1(force_bytes(content)).hexdigest())
+    compiled = parsed_templates.get(key)
+    if compiled is None:
+        compiled = template.Template(content, name=name)
+        parsed_templates.set(key, compiled)
+    return compiled
+
 
 def parse_placeholder(parser, token):
     """Parse the `PlaceholderNode` parameters.
@@ -119,8 +161,6 @@ class PlaceholderNode(template.Node):
         self.as_varname = as_varname
         self.section = section
 
-        self.found_in_block = None
-
     def get_widget(self, page, language, fallback=Textarea):
         """Given the name of a placeholder return a `Widget` subclass
         like Textarea or TextInput."""
@@ -222,7 +262,7 @@ class PlaceholderNode(template.Node):
             return ''
         if self.parsed:
             try:
-                t = template.Template(content, name=self.name)
+                t = get_parsed_template(content, self.name)
                 content = mark_safe(t.render(context))
             except TemplateSyntaxError as error:
                 if global_settings.DEBUG:
@@ -361,13 +401,26 @@ class JsonPlaceholderNode(PlaceholderNode):
     """
 
     def get_render_content(self, context):
+        """Return the decoded content. The decoded objects are shared
+        between the renders and should not be modified."""
         import json
         content = self.get_content_from_context(context)
-        try:
-            return json.loads(str(content))
-        except:
-            logger.warning("JsonPlaceholderNode: coudn't decode json")
-        return content
+        if not content:
+            return content
+        lang = context.get('lang', settings.PAGE_DEFAULT_LANGUAGE)
+        key = (context[self.page].id, self.ctype, lang,
+            hashlib.sha1(force_bytes(content)).hexdigest())
+        decoded = decoded_json.get(key, JSON_NOT_DECODED)
+        if decoded is JSON_NOT_DECODED:
+            try:
+                decoded = json.loads(str(content))
+            except:
+                logger.warning("JsonPlaceholderNode: coudn't decode json")
+                decoded = JSON_DECODE_ERROR
+            decoded_json.set(key, decoded)
+        if decoded is JSON_DECODE_ERROR:
+            return content
+        return decoded
 
 
 class MarkdownPlaceholderNode(PlaceholderNode):
@@ -377,8 +430,32 @@ class MarkdownPlaceholderNode(PlaceholderNode):
 
     widget = Textarea
 
+    MARKDOWN_KEY = "page_markdown_%d_%d_%s"
+
+    def get_markdown_key(self, page, content):
+        """Return the cache key of the HTML of a markdown content. The
+        key changes with the generation of the page, the content and
+        the markdown extensions."""
+        configs = settings.PAGE_MARKDOWN_EXTENSION_CONFIGS
+        source = force_bytes(content) + force_bytes(repr((
+            settings.PAGE_MARKDOWN_EXTENSIONS, sorted(configs.items()))))
+        return self.MARKDOWN_KEY % (page.id, page.get_generation(),
+            hashlib.sha1(source).hexdigest())
+
     def render(self, context):
-        """Render markdown."""
-        import markdown
+        """Render markdown, the HTML is cached."""
         content = self.get_content_from_context(context)
-        return markdown.markdown(content)
+        if not content:
+            return ''
+        key = self.get_markdown_key(context[self.page], content)
+        html = rendered_markdown.get(key)
+        if html is None:
+            html = cache.get(key)
+            if html is None:
+                import markdown
+                html = markdown.markdown(content,
+                    extensions=settings.PAGE_MARKDOWN_EXTENSIONS,
+                    extension_configs=settings.PAGE_MARKDOWN_EXTENSION_CONFIGS)
+                cache.set(key, html)
+            rendered_markdown.set(key, html)
+        return html
@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.db.models import Max
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.sites.models import Site
@@ -254,6 +255,7 @@ def pages_to_json(queryset):
         indent=JSON_PAGE_EXPORT_INDENT, sort_keys=True)
 
 
+@transaction.atomic
 def json_to_pages(json, user, preferred_lang=None):
     """
     Attept to create/update pages from JSON string json.  user is the
@@ -1,5 +1,6 @@
 import polib
 import os
+from django.db import transaction
 from pages.models import Page, Content
 import sys
 from pages import settings
@@ -64,6 +65,7 @@ def export_po_files(path='poexport', stdout=None):
         """in the %s directory.\n""" % path)
 
 
+@transaction.atomic
 def import_po_files(path='poexport', stdout=None):
     """
     Import all the content updates from the po files into
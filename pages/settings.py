@@ -76,6 +76,12 @@ PAGE_TAGGING_FIELD = getattr(settings, 'PAGE_TAGGING_FIELD', _default_tagging_fi
 # pages revision information in the database
 PAGE_CONTENT_REVISION = getattr(settings, 'PAGE_CONTENT_REVISION', False)
 
+# Number of superseded contents kept for every page, language and
+# placeholder by the ``pages_compact_content`` command. ``None`` keeps the
+# whole history.
+PAGE_CONTENT_HISTORY_LIMIT = getattr(settings, 'PAGE_CONTENT_HISTORY_LIMIT',
+                                     None)
+
 # A list tuples that defines the languages that pages can be translated into.
 #
 # gettext_noop = lambda s: s
@@ -177,6 +183,49 @@ PAGE_UPLOAD_ROOT = getattr(settings, 'PAGE_UPLOAD_ROOT', 'upload')
 # setting
 PAGE_REAL_TIME_SEARCH = getattr(settings, 'PAGE_REAL_TIME_SEARCH', False)
 
+# Number of seconds a process can spend rebuilding the content of a page
+# after an invalidation. Meanwhile the other processes are served the content
+# cached before the invalidation instead of querying the database as well.
+# ``0`` disables this protection.
+PAGE_CONTENT_REBUILD_LOCK_TIMEOUT = getattr(settings,
+    'PAGE_CONTENT_REBUILD_LOCK_TIMEOUT', 10)
+
+# Number of seconds a path that matches no page is remembered as such in the
+# pages cache, the paths of the existing pages are cached until a page changes.
+PAGE_ROUTE_NOT_FOUND_TIMEOUT = getattr(settings,
+    'PAGE_ROUTE_NOT_FOUND_TIMEOUT', 60)
+
+# Number of entries of the pages cache kept in the memory of every process,
+# in front of the ``pages`` (or ``default``) Django cache. Every process
+# sees the changes made by the others after at most
+# ``PAGE_CACHE_LOCAL_TIMEOUT`` seconds. ``0`` disables the local cache.
+PAGE_CACHE_LOCAL_SIZE = getattr(settings, 'PAGE_CACHE_LOCAL_SIZE', 0)
+PAGE_CACHE_LOCAL_TIMEOUT = getattr(settings, 'PAGE_CACHE_LOCAL_TIMEOUT', 5)
+
+# Number of compiled templates of ``parsed`` placeholders kept in memory by
+# every process. Set it to ``0`` to compile the content on every render.
+PAGE_PARSED_TEMPLATE_CACHE_SIZE = getattr(settings,
+    'PAGE_PARSED_TEMPLATE_CACHE_SIZE', 1000)
+
+# Extensions, and their configuration, used by the markdown placeholders
+PAGE_MARKDOWN_EXTENSIONS = getattr(settings, 'PAGE_MARKDOWN_EXTENSIONS', [])
+PAGE_MARKDOWN_EXTENSION_CONFIGS = getattr(settings,
+    'PAGE_MARKDOWN_EXTENSION_CONFIGS', {})
+
+# Number of HTML renderings of the markdown placeholders kept in memory by
+# every process in front of the pages cache. ``0`` disables it.
+PAGE_MARKDOWN_CACHE_SIZE = getattr(settings, 'PAGE_MARKDOWN_CACHE_SIZE', 0)
+
+# Number of decoded objects of the JSON placeholders kept in memory by
+# every process. Contents that are not valid JSON are remembered as well.
+PAGE_JSON_CACHE_SIZE = getattr(settings, 'PAGE_JSON_CACHE_SIZE', 1000)
+
+# Invalidate the cache of the pages, routes and aliases changed in a
+# transaction once, when the transaction commits. Django's ``TestCase``
+# never commits, disable it in the tests that check the cache.
+PAGE_INVALIDATE_ON_COMMIT = getattr(settings, 'PAGE_INVALIDATE_ON_COMMIT',
+    True)
+
 # Disable the tests by default so they don't execute when the user
 # execute manage.py test
 PAGE_ENABLE_TESTS = getattr(settings, 'PAGE_ENABLE_TESTS', False)
@@ -14,6 +14,9 @@ $(function($) {
     var action = false;
     var selected_page = false;
     var changelist = $('#page-list');
+    var picker = $('#move-picker');
+    var picker_page = 1;
+    var picker_timeout = false;
 
     if(!window.gettext) {
         window.gettext = function(str) {
@@ -30,6 +33,31 @@ $(function($) {
         action = selected_page = '';
         changelist.removeClass('insert-add insert-move');
         $('tr', changelist).removeClass('insertable highlighted selected');
+        picker.hide();
+    }
+
+    // Load a page of the valid targets of the page being moved in the picker
+    function load_move_targets(page) {
+        var moved_page = selected_page;
+        $.get(moved_page+'/move-targets/',
+            { q: $('#move-picker-q').val(), p: page },
+            function (data) {
+                if (action !== 'move' || selected_page !== moved_page) {
+                    return;
+                }
+                picker_page = data.page;
+                var results = $('#move-picker-results').empty();
+                $.each(data.targets, function (i, target) {
+                    var item = $('<li><a href="#" class="move-picker-target"></a> <span class="help"></span></li>');
+                    item.css('margin-left', target.level + 'em');
+                    $('a', item).text(target.title).data('target', target.id);
+                    $('.help', item).text(target.complete_slug);
+                    results.append(item);
+                });
+                $('#move-picker-previous').toggle(data.page > 1);
+                $('#move-picker-next').toggle(data.page < data.num_pages);
+            }
+        );
     }
 
     // Get an array of the TR elements that are children of the given page id
@@ -128,6 +156,7 @@ $(function($) {
                 init_publish_hanlder(changelist);
                 pages.fade_color($('#page-row-'+selected_page).add(get_children(selected_page)));
                 action = selected_page = '';
+                picker.hide();
                 update_actions();
             }
         );
@@ -195,8 +224,37 @@ $(function($) {
             get_children(selected_page)
         ).addClass('highlighted');
         $('tr:not(.highlighted)', changelist).addClass('insertable');
+        // the targets out of the table are searched with the picker
+        $('#move-picker-q').val('');
+        picker.show();
+        load_move_targets(1);
     }
 
+    picker.click(function (e) {
+        var link = $(e.target).closest('a');
+        if (!link.length) {
+            return;
+        }
+        e.preventDefault();
+        if (link.hasClass('cancellink')) {
+            reset_states();
+        } else if (link.hasClass('move-picker-target')) {
+            move_page(selected_page, $('#move-picker-position').val(),
+                link.data('target'));
+        } else if (link.attr('id') === 'move-picker-previous') {
+            load_move_targets(picker_page - 1);
+        } else if (link.attr('id') === 'move-picker-next') {
+            load_move_targets(picker_page + 1);
+        }
+    });
+
+    $('#move-picker-q').keyup(function () {
+        clearTimeout(picker_timeout);
+        picker_timeout = setTimeout(function () {
+            load_move_targets(1);
+        }, 300);
+    });
+
     // let's start event delegation
     changelist.click(function (e) {
         var target = $(e.target);
@@ -0,0 +1,7 @@
+from django.conf.urls import url, include
+from django.conf.urls.i18n import i18n_patterns
+
+# the pages URLs prefixed by the active language
+urlpatterns = i18n_patterns(
+    url(r'^pages/', include('pages.urls')),
+)
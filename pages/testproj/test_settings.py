@@ -169,6 +169,9 @@ PAGE_CONTENT_REVISION = True
 
 PAGE_USE_SITE_ID = True
 
+# TestCase never commits, invalidate the pages cache right away
+PAGE_INVALIDATE_ON_COMMIT = False
+
 PAGE_TAGGING = True
 
 HAYSTACK_SITECONF = 'example.search_sites'
@@ -2,9 +2,14 @@
 """Django page CMS command tests suite module."""
 from pages.models import Page, Content, PageAlias
 from pages.tests.testcase import TestCase
+from pages.utils import get_now
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import LiveServerTestCase
+import datetime
 import json
+import reversion
+import six
 
 class CommandTestCase(TestCase, LiveServerTestCase):
     """Django page CMS command tests suite class."""
@@ -21,6 +26,46 @@ class CommandTestCase(TestCase, LiveServerTestCase):
             for content in pages[0]['content_set']:
                  self.assertTrue(content['body'] in ['pull-page', 'pull-slug'])
 
+    def test_placeholders_manifest(self):
+        """Placeholders manifest command describes the templates"""
+        stdout = six.StringIO()
+        call_command('pages_placeholders_manifest', 'pages/tests/test1.html',
+            stdout=stdout)
+        manifest = json.loads(stdout.getvalue())
+        self.assertEqual(list(manifest.keys()), ['pages/tests/test1.html'])
+        self.assertEqual(manifest['pages/tests/test1.html'][0]['name'], 'body')
+
+    def test_compact_content(self):
+        """Compact content command keeps the recent and needed contents"""
+        page = self.new_page(content={'title': 'compact', 'slug': 'compact'})
+        now = get_now()
+        contents = []
+        for i in range(6):
+            content = Content(page=page, language='en-us', type='body',
+                body='body %d' % i,
+                creation_date=now + datetime.timedelta(days=i))
+            if i == 0:
+                with reversion.create_revision():
+                    content.save()
+            else:
+                content.save()
+            contents.append(content)
+        page.freeze_date = now + datetime.timedelta(days=1, hours=1)
+        page.save()
+
+        self.assertRaises(CommandError, call_command, 'pages_compact_content',
+            verbosity=0)
+        # the versions recorded before still protect their contents
+        self.set_setting('PAGE_CONTENT_REVISION', False)
+        call_command('pages_compact_content', limit=1, verbosity=0)
+
+        kept = Content.objects.filter(page=page, type='body').order_by(
+            'creation_date').values_list('body', flat=True)
+        # versioned, frozen, superseded and current contents
+        self.assertEqual(list(kept), ['body 0', 'body 1', 'body 4', 'body 5'])
+        self.assertEqual(Content.objects.filter(page=page,
+            type='title').count(), 1)
+
     def test_push(self):
         """Push command put back the content properly"""
         url =  self.live_server_url + '/pages/api/'
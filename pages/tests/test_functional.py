@@ -2,14 +2,18 @@
 """Django page CMS functionnal tests suite module."""
 from pages.models import Page, Content, PageAlias
 from pages.tests.testcase import TestCase
+from pages.cache import cache
 
 import django
 from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from pages.utils import get_now
 from pages.phttp import get_request_mock
 from pages.views import details
 import datetime
+import json
 
 add_url = reverse("admin:pages_page_add")
 changelist_url = reverse("admin:pages_page_changelist")
@@ -515,6 +519,61 @@ class FunctionnalTestCase(TestCase):
         self.assertEqual(len(root_page.valid_targets()), 0)
         self.assertEqual(str(c1.valid_targets()), "[<Page: root>]")
 
+    def test_page_move_targets(self):
+        """Test the paginated and searchable move targets view"""
+        c = self.get_admin_client()
+        root = self.new_page(content={'slug': 'root', 'title': 'root'})
+        child = self.new_page(content={'slug': 'child', 'title': 'child'},
+            parent=root)
+        self.new_page(content={'slug': 'sub', 'title': 'sub'}, parent=child)
+        for i in range(60):
+            self.new_page(content={'slug': 'other-%d' % i,
+                'title': 'Other %d' % i})
+
+        url = reverse("admin:page-move-targets", args=[child.id])
+        response = c.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['num_pages'], 2)
+        self.assertEqual(len(data['targets']), 50)
+        slugs = [t['complete_slug'] for t in data['targets']]
+        self.assertTrue('root' in slugs)
+        self.assertFalse('root/child' in slugs)
+        self.assertFalse('root/child/sub' in slugs)
+
+        response = c.get(url, {'p': 2})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(len(data['targets']), 11)
+
+        response = c.get(url, {'q': 'other 4'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(sorted(t['title'] for t in data['targets']),
+            ['Other 4', 'Other 40', 'Other 41', 'Other 42', 'Other 43',
+            'Other 44', 'Other 45', 'Other 46', 'Other 47', 'Other 48',
+            'Other 49'])
+
+        response = c.get(url, {'q': 'sub'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['targets'], [])
+
+        response = c.get(url, {'p': 3})
+        self.assertEqual(response.status_code, 404)
+
+        # the titles fall back on the other languages without a query
+        # for each target
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = c.get(url, {'language': 'de'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['targets'][0]['title'], 'root')
+        content_queries = [q for q in queries.captured_queries
+            if 'pages_content' in q['sql']]
+        self.assertEqual(len(content_queries), 1)
+
+        # the picker of the move UI uses the view
+        response = c.get(reverse('admin:pages_page_changelist'))
+        self.assertContains(response, 'id="move-picker"')
+
     def test_ajax_language(self):
         """Test that language is working properly"""
         c = self.get_admin_client()
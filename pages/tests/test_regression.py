@@ -6,7 +6,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.template import loader
 from django.core.urlresolvers import reverse
 from pages.placeholders import PlaceholderNode, get_filename
-from pages.utils import get_placeholders
+from pages.utils import get_placeholders, get_placeholders_manifest
 from pages.phttp import get_request_mock
 
 import django
@@ -269,6 +269,20 @@ class RegressionTestCase(TestCase):
             str(get_placeholders('pages/tests/extends.html')),
             '[<Placeholder Node: one>, <Placeholder Node: two>]')
 
+    def test_placeholders_static_scan(self):
+        """Placeholders are found without being rendered, in loops and
+        included templates as well"""
+        self.assertEqual(
+            str(get_placeholders('pages/tests/manifest.html')),
+            '[<Placeholder Node: contact>, <Placeholder Node: body>]')
+
+        manifest = get_placeholders_manifest(['pages/tests/manifest.html'])
+        contact, body = manifest['pages/tests/manifest.html']
+        self.assertEqual(contact['node'], 'ContactPlaceholderNode')
+        self.assertEqual(contact['section'], 'Contact')
+        self.assertEqual(body['widget'], 'RichTextarea')
+        self.assertEqual(body['parsed'], False)
+
     def test_param_position(self):
         """There was a typo in the change_form.html"""
         c = self.get_admin_client()
@@ -2,6 +2,9 @@
 """Django page CMS template test suite module."""
 from pages.models import Content
 from pages.placeholders import PlaceholderNode, get_filename
+from pages.placeholders import parsed_templates, MarkdownPlaceholderNode
+from pages.placeholders import decoded_json
+from pages.cache import cache
 from pages.tests.testcase import TestCase, MockRequest
 from pages.templatetags.pages_tags import get_page_from_string_or_id
 from pages.phttp import get_request_mock
@@ -127,6 +130,35 @@ class TemplateTestCase(TestCase):
         context = {'current_page': page, 'lang': 'en-us'}
         self.assertEqual(render(template, context), '')
 
+    def test_parsed_template_cache(self):
+        """Test that a parsed content is compiled only once."""
+        parsed_templates.clear()
+        page = self.new_page({'title': '{{ "hello"|capfirst }}'})
+        context = {'current_page': page, 'lang': 'en-us'}
+        pl_parsed = """{% load pages_tags %}{% placeholder title parsed %}"""
+        template = self.get_template_from_string(pl_parsed)
+        self.assertEqual(render(template, context), 'Hello')
+        self.assertEqual(render(template, context), 'Hello')
+        self.assertEqual(parsed_templates.misses, 1)
+        self.assertEqual(parsed_templates.hits, 1)
+
+    def test_markdown_placeholder_cache(self):
+        """Test that the markdown HTML is cached until the page changes."""
+        page = self.new_page({'mark': '# Title'})
+        context = {'current_page': page, 'lang': 'en-us'}
+        template = self.get_template_from_string(
+            """{% load pages_tags %}{% markdownplaceholder mark %}""")
+        self.assertEqual(render(template, context), '<h1>Title</h1>')
+
+        node = MarkdownPlaceholderNode('mark')
+        key = node.get_markdown_key(page, '# Title')
+        self.assertEqual(cache.get(key), '<h1>Title</h1>')
+        cache.set(key, '<h1>Cached</h1>')
+        self.assertEqual(render(template, context), '<h1>Cached</h1>')
+
+        page.invalidate()
+        self.assertEqual(render(template, context), '<h1>Title</h1>')
+
     def test_placeholder_untranslated_content(self):
         """Test placeholder untranslated content."""
         self.set_setting("PAGE_USE_SITE_ID", False)
@@ -376,6 +408,25 @@ class TemplateTestCase(TestCase):
         context = {'current_page': page}
         self.assertEqual(render(template, context), 'wrong')
 
+    def test_json_placeholder_cache(self):
+        decoded_json.clear()
+        tpl = ("{% load pages_tags %}{% jsonplaceholder p1 as v %}{{ v.a }}")
+        template = self.get_template_from_string(tpl)
+        page = self.new_page({'p1': '{"a":1}'})
+        context = {'current_page': page}
+        self.assertEqual(render(template, context), '1')
+        self.assertEqual(render(template, context), '1')
+        self.assertEqual((decoded_json.misses, decoded_json.hits), (1, 1))
+
+        # the decoding errors are remembered as well
+        tpl = ("{% load pages_tags %}{% jsonplaceholder p1 %}")
+        template = self.get_template_from_string(tpl)
+        page = self.new_page({'p1': 'wrong'})
+        context = {'current_page': page}
+        self.assertEqual(render(template, context), 'wrong')
+        self.assertEqual(render(template, context), 'wrong')
+        self.assertEqual((decoded_json.misses, decoded_json.hits), (2, 2))
+
     def test_file_placeholder(self):
         tpl = ("{% load pages_tags %}{% fileplaceholder f1 %}")
 
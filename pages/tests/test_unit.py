@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 """Django page CMS unit test suite module."""
-from pages.models import Page, Content
-from pages.tests.testcase import TestCase
+from pages.models import Page, Content, PageAlias
+from pages.tests.testcase import TestCase, new_page
 from pages import urlconf_registry as reg
+from pages import settings as pages_settings
 from pages.phttp import get_language_from_request
 from pages.phttp import get_request_mock, remove_slug
 from pages.utils import get_now
@@ -12,10 +13,16 @@ from django.http import Http404
 from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
 from django.template import Context
+from django.utils import translation
 from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.test import TransactionTestCase
 from taggit.models import Tag
 
 import datetime
+import reversion
+import unittest
 
 
 class UnitTestCase(TestCase):
@@ -189,6 +196,31 @@ class UnitTestCase(TestCase):
             only_context=True)['current_page'],
             page2)
 
+    def test_first_root_cache(self):
+        """
+        Check that the first root is found without a cache key per page.
+        """
+        from pages.cache import cache
+        page1 = self.new_page(content={'slug': 'page1'})
+        child = self.new_page(content={'slug': 'child'}, parent=page1)
+        child = Page.objects.get(pk=child.pk)
+        calls = self.record_calls(cache, 'get_many')
+        with self.assertNumQueries(0):
+            self.assertFalse(child.is_first_root())
+        self.assertEqual(calls, [])
+        self.assertTrue(Page.objects.get(pk=page1.pk).is_first_root())
+        page = Page.objects.get(pk=page1.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(page.is_first_root())
+        # one round trip for each root page instance, none for the child
+        self.assertEqual(len(calls), 2)
+
+        # a new first root page
+        page0 = self.new_page(content={'slug': 'page0'})
+        page0.move_to(page1, 'left')
+        self.assertTrue(Page.objects.get(pk=page0.pk).is_first_root())
+        self.assertFalse(Page.objects.get(pk=page1.pk).is_first_root())
+
     def test_root_page_hidden_slug(self):
         """
         Check that the root works properly in every case.
@@ -233,6 +265,324 @@ class UnitTestCase(TestCase):
             [c]
         )
 
+    def test_content_dicts_bulk_load(self):
+        """
+        Check that every placeholder of a page is loaded with one query.
+        """
+        page = self.new_page(content={'slug': 'page1', 'title': 'hello',
+            'body': 'old body'})
+        Content(page=page, language='en-us', type='body',
+            body='new body', creation_date=get_now()).save()
+        Content(page=page, language='de', type='title', body='hallo').save()
+        page = Page.objects.get(pk=page.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(page.title('en-us'), 'hello')
+        with self.assertNumQueries(0):
+            self.assertEqual(page.get_content('en-us', 'body'), 'new body')
+            self.assertEqual(page.get_content('de', 'title'), 'hallo')
+            self.assertEqual(page.get_content('fr-ch', 'body'), '')
+        # the shared cache has been filled for every placeholder as well
+        page = Page.objects.get(pk=page.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(page.get_content('de', 'title'), 'hallo')
+            self.assertEqual(page.get_content('en-us', 'body'), 'new body')
+
+    def test_content_current_marker(self):
+        """
+        Check that only the latest content of a placeholder is current.
+        """
+        page = self.new_page(content={'slug': 'page1', 'body': 'first'})
+        first = Content.objects.get(page=page, type='body')
+        self.assertTrue(first.is_current)
+        second = Content(page=page, language='en-us', type='body',
+            body='second')
+        second.save()
+        self.assertTrue(second.is_current)
+        self.assertEqual(Content.objects.filter(page=page, type='body',
+            is_current=True).count(), 1)
+
+        with self.assertNumQueries(1):
+            content = Content.objects.get_content_object(page, 'en-us', 'body')
+        self.assertEqual(content.body, 'second')
+
+        # the previous content becomes current again
+        second.delete()
+        self.assertTrue(Content.objects.get(pk=first.pk).is_current)
+        content = Content.objects.get_content_object(page, 'en-us', 'body')
+        self.assertEqual(content.body, 'first')
+
+        # the raw saves of loaddata skip Content.save
+        from django.db import models
+        third = Content(page=page, language='en-us', type='body',
+            body='third')
+        models.Model.save_base(third, raw=True)
+        self.assertTrue(Content.objects.get(pk=third.pk).is_current)
+        self.assertFalse(Content.objects.get(pk=first.pk).is_current)
+        content = Content.objects.get_content_object(page, 'en-us', 'body')
+        self.assertEqual(content.body, 'third')
+
+    def test_frozen_content_batch(self):
+        """
+        Check that the content of a frozen page is resolved at once.
+        """
+        page = self.new_page(content={'slug': 'frozen'})
+        with reversion.create_revision():
+            Content.objects.save_content_if_changed(
+                page, 'en-us', 'title', 'before')
+            Content.objects.save_content_if_changed(
+                page, 'de', 'title', 'vorher')
+            Content.objects.save_content_if_changed(
+                page, 'en-us', 'body', 'body before')
+        freeze_date = get_now()
+        with reversion.create_revision():
+            Content.objects.save_content_if_changed(
+                page, 'en-us', 'title', 'after')
+            Content.objects.save_content_if_changed(
+                page, 'de', 'title', 'nachher')
+        Content(page=page, language='fr-ch', type='title',
+            body='apres').save()
+        # without revision, the latest content before the freeze is used
+        footer = Content(page=page, language='en-us', type='footer',
+            body='old footer')
+        footer.save()
+        Content.objects.filter(pk=footer.pk).update(
+            creation_date=freeze_date - datetime.timedelta(days=1))
+        Content(page=page, language='en-us', type='footer',
+            body='footer', creation_date=freeze_date - datetime.timedelta(
+                hours=1)).save()
+        Content(page=page, language='en-us', type='footer',
+            body='new footer').save()
+
+        page = Page.objects.get(pk=page.pk)
+        page.freeze_date = freeze_date
+        page.save()
+        page = Page.objects.get(pk=page.pk)
+        page.get_generation()
+        # contents, versions, winning versions and fallback bodies
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(page.title('en-us'), 'before')
+        self.assertEqual(len(queries.captured_queries), 4)
+        # only the winning bodies are read
+        self.assertFalse('"body"' in queries.captured_queries[0]['sql'])
+        self.assertFalse('serialized_data' in
+            queries.captured_queries[1]['sql'])
+        with self.assertNumQueries(0):
+            self.assertEqual(page.title('de'), 'vorher')
+            self.assertEqual(page.get_content('fr-ch', 'title'), '')
+            self.assertEqual(page.get_content('en-us', 'body'),
+                'body before')
+            self.assertEqual(page.get_content('en-us', 'footer'), 'footer')
+        # the frozen content is cached
+        page = Page.objects.get(pk=page.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(page.title('de'), 'vorher')
+
+        page.freeze_date = None
+        page.save()
+        self.assertEqual(page.title('de'), 'nachher')
+
+    def test_prefetch_content(self):
+        """
+        Check that the content of a whole queryset is loaded at once.
+        """
+        root = self.new_page(content={'slug': 'root', 'title': 'root'})
+        for i in range(5):
+            self.new_page(content={'slug': 'child-%d' % i,
+                'title': 'child %d' % i}, parent=root)
+        Content(page=root, language='de', type='title', body='wurzel').save()
+        root = Page.objects.get(pk=root.pk)
+
+        with self.assertNumQueries(2):
+            children = list(root.get_children_for_frontend())
+            self.assertEqual([p.title() for p in children],
+                ['child %d' % i for i in range(5)])
+
+        # partially prefetched languages are completed on demand
+        pages = list(Page.objects.filter(pk=root.pk).prefetch_content(
+            ctypes=['title'], languages=['en-us']))
+        with self.assertNumQueries(0):
+            self.assertEqual(pages[0].title('en-us'), 'root')
+        with self.assertNumQueries(1):
+            self.assertEqual(pages[0].title('de'), 'wurzel')
+
+        # the titles are now in the cache
+        with self.assertNumQueries(1):
+            children = list(root.get_children_for_frontend())
+            self.assertEqual(children[0].title(), 'child 0')
+
+    def test_invalidate_batched(self):
+        """
+        Check that a page is invalidated by incrementing its generation
+        alone: the content keys are retired without being deleted. The keys
+        of the ancestors are kept.
+        """
+        from pages.cache import cache
+        root = self.new_page(content={'slug': 'root', 'title': 'root'})
+        child = self.new_page(content={'slug': 'child', 'title': 'child'},
+            parent=root)
+        self.assertEqual(root.title(), 'root')
+        self.assertEqual(child.title(), 'child')
+        root_key = Content.objects.get_content_dict_key(root, 'title')
+        child_key = Content.objects.get_content_dict_key(child, 'title')
+        self.assertNotEqual(cache.get(root_key), None)
+
+        deletes = self.record_calls(cache, 'delete_many')
+        increments = self.record_calls(cache, 'incr')
+        with self.assertNumQueries(0):
+            child.invalidate()
+        self.assertEqual(
+            Content.objects.get_content_dict_key(
+                Page.objects.get(pk=root.pk), 'title'), root_key)
+        self.assertEqual(deletes, [])
+        self.assertEqual(len(increments), 1)
+        self.assertNotEqual(
+            Content.objects.get_content_dict_key(child, 'title'), child_key)
+
+        self.assertEqual(child.title(), 'child')
+        Content(page=child, language='en-us', type='title',
+            body='new child').save()
+        child.invalidate()
+        self.assertEqual(child.title(), 'new child')
+        self.assertEqual(Page.objects.get(pk=child.pk).title(), 'new child')
+
+    def test_content_rebuild_lock(self):
+        """
+        Check that the previous content is served while another process
+        rebuilds it.
+        """
+        from pages.cache import cache
+        page = self.new_page(content={'slug': 'page1', 'title': 'old'})
+        self.assertEqual(page.title(), 'old')
+        Content(page=page, language='en-us', type='title',
+            body='new').save()
+        page.invalidate()
+
+        page = Page.objects.get(pk=page.pk)
+        lock = Content.objects.PAGE_CONTENT_LOCK_KEY % (
+            page.id, page.get_generation())
+        cache.add(lock, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(page.title(), 'old')
+
+        cache.delete(lock)
+        page = Page.objects.get(pk=page.pk)
+        self.assertEqual(page.title(), 'new')
+        # the lock is released after the rebuild
+        self.assertEqual(cache.get(lock), None)
+
+    def test_lru_cache(self):
+        """
+        Check that the in-process cache evicts the least recently used
+        entries first.
+        """
+        from pages.cache import LRUCache
+        lru = LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEqual(lru.get('a'), 1)
+        lru.set('c', 3)
+        # b is the least recently used entry
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('c'), 3)
+
+    def test_two_tier_cache(self):
+        """
+        Check the local cache in front of the pages cache.
+        """
+        from django.core.cache import caches
+        from pages import managers, models
+        from pages.cache import TwoTierCache
+        backend = caches['default']
+        cache = TwoTierCache(backend, 10, 60)
+        cache.set('key', 'value')
+        backend.delete('key')
+        # served by the local tier
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.get_many(['key', 'other']), {'key': 'value'})
+        cache.delete_many(['key'])
+        self.assertEqual(cache.get('key', 'default'), 'default')
+
+        page = self.new_page(content={'slug': 'page1', 'title': 'hello'})
+        models.cache = managers.cache = cache
+        try:
+            self.assertEqual(page.title(), 'hello')
+            key = Content.objects.get_content_dict_key(page, 'title')
+            self.assertEqual(cache.local.get(key)['en-us'], 'hello')
+            Content(page=page, language='en-us', type='title',
+                body='new hello').save()
+            page.invalidate()
+            page = Page.objects.get(pk=page.pk)
+            self.assertEqual(page.title(), 'new hello')
+        finally:
+            models.cache = managers.cache = backend
+
+    def test_get_placeholders_cache(self):
+        """
+        Check that the placeholders of a template are only searched once.
+        """
+        from pages import utils
+        calls = self.record_calls(utils, '_get_placeholders')
+        utils.clear_placeholders_cache()
+        names = [p.ctype for p in
+            utils.get_placeholders('pages/examples/nice.html')]
+        self.assertTrue('title' in names)
+        self.assertEqual([p.ctype for p in
+            utils.get_placeholders('pages/examples/nice.html')], names)
+        self.assertEqual(len(calls), 1)
+        # the result depends on the page templates settings
+        self.set_setting('PAGE_TEMPLATES', ())
+        utils.get_placeholders('pages/examples/nice.html')
+        self.assertEqual(len(calls), 2)
+
+    def test_url_path_cache(self):
+        """
+        Check that the URL of a page is built like reverse would, without
+        queries, and follows the changes of its complete slug.
+        """
+        root = self.new_page(content={'slug': 'root'})
+        parent = self.new_page(content={'slug': 'parent'}, parent=root)
+        child = self.new_page(content={'slug': 'child'}, parent=parent)
+        child = Page.objects.get(pk=child.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(child.get_url_path(),
+                reverse('pages-details-by-path', args=['root/parent/child']))
+            self.assertEqual(child.get_url_path('fr-ch'),
+                '/pages/root/parent/child')
+
+        parent.slug = 'new-parent'
+        parent.save()
+        self.assertEqual(parent.get_url_path(), '/pages/root/new-parent')
+        child = Page.objects.get(pk=child.pk)
+        self.assertEqual(child.get_url_path(), '/pages/root/new-parent/child')
+
+        self.set_setting("PAGE_USE_LANGUAGE_PREFIX", True)
+        self.assertEqual(child.get_url_path('fr-ch'),
+            reverse('pages-details-by-path',
+                args=['fr-ch', 'root/new-parent/child']))
+        self.assertEqual(child.get_url_path('de'),
+            '/pages/de/root/new-parent/child')
+
+    def test_url_path_i18n_patterns(self):
+        """
+        Check that the URL of a page follows the active language when
+        the pages URLs are in ``i18n_patterns``.
+        """
+        root = self.new_page(content={'slug': 'root'})
+        child = self.new_page(content={'slug': 'child'}, parent=root)
+        with override_settings(ROOT_URLCONF='pages.testproj.i18n_urls'):
+            for language in ('en-us', 'de', 'fr-ch', 'de'):
+                with translation.override(language):
+                    child = Page.objects.get(pk=child.pk)
+                    url = reverse('pages-details-by-path',
+                        args=['root/child'])
+                    self.assertEqual(url, '/%s/pages/root/child' % language)
+                    self.assertEqual(child.get_url_path(), url)
+                    self.assertEqual(
+                        Page.objects.strip_path(url), 'root/child')
+                    self.assertEqual(
+                        Page.objects.resolve_path(url, language), child)
+
     def test_strict_urls(self):
         """
         Check that the strict handling of URLs work as
@@ -258,6 +608,85 @@ class UnitTestCase(TestCase):
             page2
         )
 
+    def test_resolve_path(self):
+        """
+        Check that a path is resolved with a single query, to the page
+        or to its deepest delegating ancestor.
+        """
+        page1 = self.new_page(content={'slug': 'page1'})
+        page2 = self.new_page(content={'slug': 'page2'}, parent=page1)
+        page3 = self.new_page(content={'slug': 'page3'}, parent=page2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                Page.objects.resolve_path('page1/page2/page3', 'en-us'),
+                page3)
+        deep_path = 'page1/page2/' + '/'.join(['a'] * 50)
+        with self.assertNumQueries(1):
+            self.assertEqual(Page.objects.resolve_path(deep_path, 'en-us'),
+                None)
+
+        page1.delegate_to = 'test'
+        page1.save()
+        page2.delegate_to = 'test'
+        page2.save()
+        self.assertEqual(
+            Page.objects.resolve_path(deep_path, 'en-us'), page2)
+        self.assertEqual(
+            Page.objects.resolve_path('page1/page2/page3', 'en-us'), page3)
+        self.assertEqual(
+            Page.objects.resolve_path('page1/other', 'en-us'), page1)
+        self.assertEqual(Page.objects.resolve_path('x' * 300, 'en-us'), None)
+
+    def test_routing_cache(self):
+        """
+        Check that the page of a path, or its absence, is cached until a
+        page changes.
+        """
+        self.set_setting("PAGE_USE_SITE_ID", True)
+        page1 = self.new_page(content={'slug': 'page1'})
+        self.assertEqual(Page.objects.resolve_path('page1', 'en-us'), page1)
+        with self.assertNumQueries(0):
+            page = Page.objects.resolve_path('/page1/', 'en-us')
+        self.assertEqual(page, page1)
+        self.assertEqual(page.complete_slug, 'page1')
+
+        self.assertEqual(Page.objects.resolve_path('page2', 'en-us'), None)
+        with self.assertNumQueries(0):
+            self.assertEqual(Page.objects.resolve_path('page2', 'en-us'),
+                None)
+        page2 = self.new_page(content={'slug': 'page2'})
+        self.assertEqual(Page.objects.resolve_path('page2', 'en-us'), page2)
+
+        page2.sites.clear()
+        self.assertEqual(Page.objects.resolve_path('page2', 'en-us'), None)
+        page1.delete()
+        self.assertEqual(Page.objects.resolve_path('page1', 'en-us'), None)
+
+    def test_alias_map(self):
+        """
+        Check that the aliases are resolved in memory and reloaded when
+        they change.
+        """
+        page = self.new_page(content={'slug': 'page1'})
+        PageAlias(page=page, url='/index.php').save()
+        PageAlias(page=page, url='index.php?page=page1').save()
+        request = get_request_mock()
+        PageAlias.objects.get_alias_map()
+
+        with self.assertNumQueries(0):
+            alias = PageAlias.objects.from_path(request, 'index.php', None)
+        self.assertEqual(alias.url, '/index.php')
+        request.META['QUERY_STRING'] = 'page=page1'
+        alias = PageAlias.objects.from_path(request, 'index.php', None)
+        self.assertEqual(alias.url, '/index.php?page=page1')
+        self.assertEqual(alias.page, page)
+
+        PageAlias.objects.get(url='/index.php').delete()
+        request.META['QUERY_STRING'] = ''
+        self.assertEqual(
+            PageAlias.objects.from_path(request, 'index.php', None), None)
+
     def test_remove_slug(self):
         """Test the remove slug function."""
         self.assertEqual(remove_slug('hello/world/toto'), 'hello/world')
@@ -272,6 +701,200 @@ class UnitTestCase(TestCase):
         page2.move_to(target=page1)
         self.assertEqual(page2.get_complete_slug(), expected_url)
 
+    def test_complete_slug_cascade(self):
+        """Renaming or moving a page rewrites the complete slug of
+        its descendants with a single update."""
+        section = self.new_page(content={'slug': 'section'})
+        child = self.new_page(content={'slug': 'child'}, parent=section)
+        self.new_page(content={'slug': 'child'}, parent=child)
+        for i in range(5):
+            self.new_page(content={'slug': 'leaf%d' % i}, parent=child)
+        # a suffixed slug keeps its suffix
+        leaf = self.new_page(content={'slug': 'leaf'}, parent=section)
+        Page.objects.filter(pk=leaf.pk).update(complete_slug='section/leaf-1')
+        other = self.new_page(content={'slug': 'other'})
+
+        section = Page.objects.get(pk=section.pk)
+        section.slug = 'renamed'
+        # the routes are retired once the descendants are up to date
+        routes = self.record_calls(Page.objects, 'invalidate_routes',
+            lambda: Page.objects.get(slug='leaf3').complete_slug)
+        with CaptureQueriesContext(connection) as queries:
+            section.save()
+        self.assertEqual(routes, ['renamed/child/leaf3'])
+        updates = [q['sql'] for q in queries.captured_queries
+            if 'UPDATE' in q['sql'].upper()]
+        self.assertEqual(len(updates), 2)
+
+        slugs = sorted(Page.objects.filter(tree_id=section.tree_id)
+            .values_list('complete_slug', flat=True))
+        self.assertEqual(slugs, ['renamed', 'renamed/child',
+            'renamed/child/child', 'renamed/child/leaf0',
+            'renamed/child/leaf1', 'renamed/child/leaf2',
+            'renamed/child/leaf3', 'renamed/child/leaf4',
+            'renamed/leaf-1'])
+
+        # saving again does not touch the descendants
+        with CaptureQueriesContext(connection) as queries:
+            section.save()
+        updates = [q['sql'] for q in queries.captured_queries
+            if 'UPDATE' in q['sql'].upper()]
+        self.assertEqual(len(updates), 1)
+
+        child = Page.objects.get(pk=child.pk)
+        child.move_to(other)
+        self.assertEqual(
+            Page.objects.get(slug='child', parent=child).complete_slug,
+            'other/child/child')
+        self.assertEqual(
+            Page.objects.get(slug='leaf3').complete_slug,
+            'other/child/leaf3')
+
+        # a descendant out of sync is rebuilt from its parent
+        Page.objects.filter(slug='leaf0').update(complete_slug='stale/leaf0')
+        other = Page.objects.get(pk=other.pk)
+        other.slug = 'another'
+        other.save()
+        self.assertEqual(
+            Page.objects.get(slug='leaf0').complete_slug,
+            'another/child/leaf0')
+        self.assertEqual(
+            Page.objects.get(slug='leaf4').complete_slug,
+            'another/child/leaf4')
+
+    def test_free_complete_slug(self):
+        """The next free numbered slug is found with a single query."""
+        pages = [self.new_page(content={'slug': 'dup'}) for i in range(4)]
+        self.assertEqual([page.complete_slug for page in pages],
+            ['dup', 'dup-1', 'dup-2', 'dup-3'])
+        self.new_page(content={'slug': 'child'}, parent=pages[1])
+        self.new_page(content={'slug': 'dup-other'})
+
+        with self.assertNumQueries(1):
+            taken = Page.objects.taken_complete_slugs('dup')
+        self.assertEqual(taken, set(['dup', 'dup-1', 'dup-2', 'dup-3']))
+        # the other pages are filtered out by the database
+        self.assertEqual(
+            Page.objects.with_complete_slug('dup', numbered=True).count(), 4)
+        self.new_page(content={'slug': 'a.b'})
+        self.assertEqual(Page.objects.taken_complete_slugs('a.b'),
+            set(['a.b']))
+        self.assertEqual(Page.objects.taken_complete_slugs('axb'), set())
+        with self.assertNumQueries(1):
+            free = Page.objects.free_complete_slug('dup', pages[2].id)
+        self.assertEqual(free, 'dup-2')
+
+        pages[1].delete()
+        self.assertEqual(self.new_page(content={'slug': 'dup'}).complete_slug,
+            'dup-1')
+        self.assertEqual(self.new_page(content={'slug': 'dup'}).complete_slug,
+            'dup-4')
+
+    def test_effective_template(self):
+        """The template of a page is inherited without any query."""
+        nice = 'pages/examples/nice.html'
+        cool = 'pages/examples/cool.html'
+        root = self.new_page(content={'slug': 'root'}, template=nice)
+        child = self.new_page(content={'slug': 'child'}, parent=root,
+            template='')
+        grandchild = self.new_page(content={'slug': 'grandchild'},
+            parent=child, template=None)
+        templated = self.new_page(content={'slug': 'templated'},
+            parent=root, template=cool)
+        below = self.new_page(content={'slug': 'below'}, parent=templated,
+            template='')
+        other = self.new_page(content={'slug': 'other'}, template='')
+
+        grandchild = Page.objects.get(pk=grandchild.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(grandchild.get_template(), nice)
+        self.assertEqual(Page.objects.get(pk=below.pk).get_template(), cool)
+        self.assertEqual(Page.objects.get(pk=other.pk).get_template(),
+            pages_settings.PAGE_DEFAULT_TEMPLATE)
+
+        # a new template is propagated to the subtree, except where
+        # a descendant has its own template
+        root = Page.objects.get(pk=root.pk)
+        root.template = 'pages/examples/editor.html'
+        routes = self.record_calls(Page.objects, 'invalidate_routes',
+            lambda: Page.objects.get(pk=grandchild.pk).effective_template)
+        root.save()
+        self.assertEqual(routes, ['pages/examples/editor.html'])
+        self.assertEqual(Page.objects.get(pk=grandchild.pk).get_template(),
+            'pages/examples/editor.html')
+        self.assertEqual(Page.objects.get(pk=below.pk).get_template(), cool)
+
+        # moving a subtree updates its templates
+        child = Page.objects.get(pk=child.pk)
+        child.move_to(Page.objects.get(pk=templated.pk))
+        self.assertEqual(Page.objects.get(pk=child.pk).get_template(), cool)
+        self.assertEqual(Page.objects.get(pk=grandchild.pk).get_template(),
+            cool)
+        templated = Page.objects.get(pk=templated.pk)
+        templated.move_to(Page.objects.get(pk=other.pk))
+        templated = Page.objects.get(pk=templated.pk)
+        templated.template = ''
+        templated.save()
+        for pk in (templated.pk, below.pk, child.pk, grandchild.pk):
+            self.assertEqual(Page.objects.get(pk=pk).get_template(),
+                pages_settings.PAGE_DEFAULT_TEMPLATE)
+
+        # the raw saves of loaddata skip Page.save, a fixture dumped
+        # without the effective templates loads them empty
+        from django.db import models
+        Page.objects.filter(pk=other.pk).update(template=nice)
+        models.Model.save_base(Page.objects.get(pk=child.pk), raw=True)
+        for pk in (child.pk, grandchild.pk):
+            self.assertEqual(Page.objects.get(pk=pk).get_template(), nice)
+        models.Model.save_base(Page.objects.get(pk=below.pk), raw=True)
+        self.assertEqual(Page.objects.get(pk=below.pk).get_template(), nice)
+
+    @unittest.skipUnless(hasattr(transaction, 'on_commit'),
+        'Django 1.8 invalidates immediately')
+    def test_invalidate_on_commit(self):
+        """Pages invalidated in a transaction are invalidated once, when
+        the transaction commits."""
+        from pages.cache import cache, get_invalidation_queue
+        self.set_setting("PAGE_INVALIDATE_ON_COMMIT", True)
+        root = self.new_page(content={'slug': 'root', 'title': 'root'})
+        child = self.new_page(content={'slug': 'child', 'title': 'child'},
+            parent=root)
+        # pages created in the test are already queued
+        queue = get_invalidation_queue()
+        queue()
+        root_generation = Page.objects.get(pk=root.pk).get_generation()
+        child_generation = Page.objects.get(pk=child.pk).get_generation()
+
+        calls = self.record_calls(cache, 'incr')
+        registrations = self.record_calls(transaction, 'on_commit')
+        with self.assertNumQueries(0):
+            child.invalidate()
+            child.invalidate()
+            root.invalidate()
+        self.assertEqual(calls, [])
+        # the queue is registered once per savepoint level
+        self.assertEqual(len(registrations), 1)
+        with transaction.atomic():
+            root.invalidate()
+        self.assertEqual(len(registrations), 1)
+        # other readers still use the committed generations
+        self.assertEqual(
+            Page.objects.get(pk=child.pk).get_generation(),
+            child_generation)
+        # the invalidated instance does not read the old keys
+        self.assertNotEqual(child.get_generation(), child_generation)
+
+        # the commit of the transaction
+        with self.assertNumQueries(0):
+            queue()
+        queue()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Page.objects.get(pk=child.pk).get_generation(),
+            child_generation + 1)
+        self.assertEqual(Page.objects.get(pk=root.pk).get_generation(),
+            root_generation + 1)
+        self.assertEqual(child.get_generation(), child_generation + 1)
+
     def test_path_too_long(self):
         """Test that the CMS try to resolve the whole page path to find
         a suitable sub path with delegation."""
@@ -358,3 +981,110 @@ class UnitTestCase(TestCase):
               '{% for page in pages %}{{ page.slug }},{% endfor %}'
         template = self.get_template_from_string(pl1)
         self.assertEqual(template.render(Context({})), u'footer-page,footer-page2,')
+
+
+@unittest.skipUnless(hasattr(transaction, 'on_commit'),
+    'Django 1.8 invalidates immediately')
+class TransactionUnitTestCase(TransactionTestCase):
+    """Tests of the caches of the pages around transactions that really
+    commit or roll back."""
+    fixtures = ['pages_tests.json']
+
+    def setUp(self):
+        from pages.cache import cache
+        cache.clear()
+        old_value = pages_settings.PAGE_INVALIDATE_ON_COMMIT
+        pages_settings.PAGE_INVALIDATE_ON_COMMIT = True
+        self.addCleanup(setattr, pages_settings,
+            'PAGE_INVALIDATE_ON_COMMIT', old_value)
+
+    def clear_alias_map(self):
+        """Make the process reload the aliases on the next lookup."""
+        from pages import managers
+        PageAlias.objects.get_alias_map()
+        managers._alias_map = (None, {})
+
+    def get_versions(self, page):
+        from pages.cache import cache
+        return (Page.objects.get(pk=page.pk).get_generation(),
+            Page.objects.get_routes_generation(),
+            cache.get(PageAlias.objects.PAGE_ALIASES_VERSION_KEY))
+
+    def test_invalidate_on_commit(self):
+        """The pages, routes and aliases changed in a transaction are
+        invalidated once, when it commits, and nothing read in between
+        is cached."""
+        from pages.cache import cache
+        page = new_page(content={'slug': 'page', 'title': 'page'})
+        self.clear_alias_map()
+        generation, routes, aliases = self.get_versions(page)
+
+        with transaction.atomic():
+            page = Page.objects.get(pk=page.pk)
+            page.slug = 'moved'
+            page.save()
+            Content.objects.save_content_if_changed(page, 'en-us', 'title',
+                'moved')
+            page.invalidate()
+            PageAlias.objects.create(page=page, url='/old-page')
+            self.assertEqual(self.get_versions(page),
+                (generation, routes, aliases))
+            self.assertEqual(Content.objects.get_content(page, 'en-us',
+                'title'), 'moved')
+            self.assertEqual(Page.objects.from_path('moved', 'en-us'), page)
+            self.assertIn('/old-page', PageAlias.objects.get_alias_map())
+            self.assertIsNone(cache.get(
+                Content.objects.get_stale_content_dict_key(page, 'title')))
+
+        self.assertEqual(self.get_versions(page),
+            (generation + 1, routes + 1, aliases + 1))
+        page = Page.objects.get(pk=page.pk)
+        self.assertEqual(Content.objects.get_content(page, 'en-us',
+            'title'), 'moved')
+        self.assertEqual(Page.objects.from_path('moved', 'en-us'), page)
+        self.assertIn('/old-page', PageAlias.objects.get_alias_map())
+
+    def test_invalidate_on_rollback(self):
+        """The invalidations of a transaction that rolls back are
+        forgotten, and nothing read in it is cached."""
+        page = new_page(content={'slug': 'page', 'title': 'page'})
+        other = new_page(content={'slug': 'other', 'title': 'other'})
+        self.assertEqual(Page.objects.from_path('page', 'en-us'), page)
+        self.clear_alias_map()
+        versions = self.get_versions(page)
+
+        try:
+            with transaction.atomic():
+                page = Page.objects.get(pk=page.pk)
+                page.slug = 'moved'
+                page.save()
+                Content.objects.save_content_if_changed(page, 'en-us',
+                    'title', 'moved')
+                page.invalidate()
+                PageAlias.objects.create(page=page, url='/old-page')
+                Content(page=page, language='fr-ch', type='title',
+                    body='deplacee').save()
+                Content.objects.get_content(page, 'en-us', 'title')
+                self.assertEqual(Page.objects.get(pk=page.pk).get_languages(),
+                    ['en-us', 'fr-ch'])
+                Page.objects.from_path('moved', 'en-us')
+                PageAlias.objects.get_alias_map()
+                raise ValueError
+        except ValueError:
+            pass
+
+        from pages.cache import get_invalidation_queue
+        self.assertIsNone(get_invalidation_queue())
+        self.assertEqual(self.get_versions(page), versions)
+        page = Page.objects.get(pk=page.pk)
+        self.assertEqual(page.get_languages(), ['en-us'])
+        self.assertEqual(Content.objects.get_content(page, 'en-us',
+            'title'), 'page')
+        self.assertEqual(Page.objects.from_path('page', 'en-us'), page)
+        self.assertIsNone(Page.objects.from_path('moved', 'en-us'))
+        self.assertNotIn('/old-page', PageAlias.objects.get_alias_map())
+
+        # the next transaction only invalidates its own pages
+        with transaction.atomic():
+            Page.objects.get(pk=other.pk).invalidate()
+        self.assertEqual(self.get_versions(page), versions)
@@ -78,6 +78,24 @@ class TestCase(TestCase):
         if name not in self.settings_to_reset:
             self.settings_to_reset[name] = old_value
 
+    def record_calls(self, obj, name, snapshot=None):
+        """Wrap the ``name`` attribute of ``obj`` until the end of the
+        test and return the list of the positional arguments of each
+        of its calls, or of what ``snapshot`` returns when it is called
+        just before."""
+        calls = []
+        original = getattr(obj, name)
+
+        def record(*args, **kwargs):
+            calls.append(snapshot() if snapshot else args)
+            return original(*args, **kwargs)
+        if name in vars(obj):
+            self.addCleanup(setattr, obj, name, original)
+        else:
+            self.addCleanup(delattr, obj, name)
+        setattr(obj, name, record)
+        return calls
+
     def assert404(self, func):
         try:
             response = func()
@@ -1,22 +1,24 @@
 # -*- coding: utf-8 -*-
 """A collection of functions for Page CMS"""
 
+import os
 import re
 import unicodedata
 
 from django.conf import settings as django_settings
-from django.utils import timezone
-from django.template import Context
+from django.core.signals import setting_changed
+from django.utils import timezone, translation
 from django import template
 from django.utils.encoding import force_text
+from django.utils.http import urlquote, RFC3986_SUBDELIMS
+from django.core.urlresolvers import get_resolver, get_script_prefix
+from django.core.urlresolvers import get_urlconf, reverse, NoReverseMatch
 from django.utils.safestring import SafeText, mark_safe
 from django.utils.functional import allow_lazy
 from django.utils import six
 
 from datetime import datetime
 
-dummy_context = Context()
-
 
 def get_now():
     if django_settings.USE_TZ:
@@ -25,36 +27,94 @@ def get_now():
         return datetime.now()
 
 
+# process level cache of the placeholders found in each template:
+# {template_name: (fingerprint, sources, mtimes, placeholders)}
+_placeholders_cache = {}
+
+
+def clear_placeholders_cache(**kwargs):
+    """Empty the cache of :func:`get_placeholders`. Connected to the
+    ``setting_changed`` signal."""
+    _placeholders_cache.clear()
+setting_changed.connect(clear_placeholders_cache)
+
+
+def _templates_fingerprint():
+    """Return the settings the placeholders discovery depends on. If they
+    change, the cache of :func:`get_placeholders` is obsolete."""
+    from pages import settings
+    return (
+        settings.PAGE_DEFAULT_TEMPLATE,
+        settings.PAGE_TEMPLATES,
+        getattr(django_settings, 'PAGE_TEMPLATES', None),
+    )
+
+
+def _sources_mtimes(sources):
+    """Return the modification times of the template files, ``None`` if
+    one of them is not a file."""
+    try:
+        return tuple(os.path.getmtime(source) for source in sources)
+    except (OSError, TypeError):
+        return None
+
+
 def get_placeholders(template_name):
     """Return a list of PlaceholderNode found in the given template.
 
+    The result is cached per template name for the whole process. When the
+    template engine runs in debug mode, the template files are checked for
+    modification, like Django reloads them.
+
     :param template_name: the name of the template file
     """
-    dummy_context.template = template.Template("")
-    try:
-        temp_wrapper = template.loader.get_template(template_name)
-    except template.TemplateDoesNotExist:
-        return []
+    fingerprint = _templates_fingerprint()
+    cached = _placeholders_cache.get(template_name)
+    if cached is not None and cached[0] == fingerprint:
+        if not template.Engine.get_default().debug:
+            return list(cached[3])
+        mtimes = _sources_mtimes(cached[1])
+        if mtimes is not None and mtimes == cached[2]:
+            return list(cached[3])
+
+    sources = []
+    placeholders = _get_placeholders(template_name, sources)
+    # a missing template is not cached
+    if sources:
+        _placeholders_cache[template_name] = (
+            fingerprint, sources, _sources_mtimes(sources), placeholders)
+    return list(placeholders)
 
-    plist, blist = [], []
-    temp = temp_wrapper.template
-    _placeholders_recursif(temp.nodelist, plist, blist)
+
+def _get_placeholders(template_name, sources):
+    """Search the given template for PlaceholderNode, the names of the
+    template files that have been read are appended to ``sources``."""
+    scan = {
+        'placeholders': [],
+        'blocks': [],
+        'super_blocks': set(),
+        'sources': sources,
+        'chain': [],
+    }
+    if not _scan_template(template_name, scan):
+        return []
 
     previous = {}
     block_to_remove = []
-    for block in blist:
+    for block in scan['blocks']:
         if block.name in previous:
-            if not hasattr(block, 'has_super_var'):
+            if block not in scan['super_blocks']:
                 block_to_remove.append(previous[block.name])
         previous[block.name] = block
 
-    def keep(p):
-        return p.found_in_block not in block_to_remove
+    def keep(found):
+        node, block = found
+        return block not in block_to_remove
 
-    placeholders = [p for p in plist if keep(p)]
+    placeholders = [p for p in scan['placeholders'] if keep(p)]
     names = []
     pfiltered = []
-    for p in placeholders:
+    for p, block in placeholders:
         if p.ctype not in names:
             pfiltered.append(p)
             names.append(p.ctype)
@@ -62,56 +122,193 @@ def get_placeholders(template_name):
     return pfiltered
 
 
-def _placeholders_recursif(nodelist, plist, blist):
+def _constant_template_name(filter_expression):
+    """Return the template name of an ``extends`` or ``include`` tag when
+    it is a string literal, ``None`` if it can only be known at render
+    time."""
+    name = getattr(filter_expression, 'var', None)
+    if isinstance(name, six.string_types) and not filter_expression.filters:
+        return name
+    return None
+
+
+def _scan_template(template_name, scan):
+    """Scan a template file, return ``False`` if it doesn't exist."""
+    if template_name in scan['chain']:
+        # recursive include
+        return True
+    try:
+        temp = template.loader.get_template(template_name).template
+    except template.TemplateDoesNotExist:
+        return False
+    # Django 1.8 has no origin outside of debug mode, the modification
+    # times are not checked there
+    origin = temp.origin
+    scan['sources'].append(origin.name if origin else template_name)
+    scan['chain'].append(template_name)
+    _placeholders_recursif(temp.nodelist, scan)
+    scan['chain'].pop()
+    return True
+
+
+def _placeholders_recursif(nodelist, scan, block=None):
     """Recursively search into a template node list for PlaceholderNode
-    node."""
-    # I needed to do this lazy import to compile the documentation
-    from django.template.loader_tags import BlockNode
+    node.
 
-    if len(blist):
-        block = blist[-1]
-    else:
-        block = None
+    This is a static analysis: nothing is rendered and the nodes are
+    left untouched. ``extends`` and ``include`` tags are followed when
+    the template name is a string literal."""
+    # I needed to do this lazy import to compile the documentation
+    from django.template.loader_tags import BlockNode, ExtendsNode
+    from django.template.loader_tags import IncludeNode
 
     for node in nodelist:
 
         if isinstance(node, BlockNode):
-            if node not in blist:
-                blist.append(node)
-            if not block:
-                block = node
+            if node not in scan['blocks']:
+                scan['blocks'].append(node)
 
         if block:
             if isinstance(node, template.base.VariableNode):
                 if(node.filter_expression.var.var == u'block.super'):
-                    block.has_super_var = True
+                    scan['super_blocks'].add(block)
 
         # extends node?
-        if hasattr(node, 'parent_name'):
-            dummy_context2 = Context()
-            dummy_context2.template = template.Template("")
-            _placeholders_recursif(node.get_parent(dummy_context2).nodelist,
-                                   plist, blist)
+        if isinstance(node, ExtendsNode):
+            parent_name = _constant_template_name(node.parent_name)
+            if parent_name:
+                _scan_template(parent_name, scan)
         # include node?
+        elif isinstance(node, IncludeNode):
+            include_name = _constant_template_name(node.template)
+            if include_name:
+                _scan_template(include_name, scan)
         elif hasattr(node, 'template') and hasattr(node.template, 'nodelist'):
-            _placeholders_recursif(node.template.nodelist, plist, blist)
+            _placeholders_recursif(node.template.nodelist, scan, block)
 
         # Is it a placeholder?
         if hasattr(node, 'page') and hasattr(node, 'parsed') and \
                 hasattr(node, 'as_varname') and hasattr(node, 'name') \
                 and hasattr(node, 'section'):
-            if block:
-                node.found_in_block = block
-            plist.append(node)
-            node.render(dummy_context)
-
-        for key in ('nodelist', 'nodelist_true', 'nodelist_false'):
-
-            if hasattr(node, key):
-                try:
-                    _placeholders_recursif(getattr(node, key), plist, blist)
-                except:
-                    pass
+            scan['placeholders'].append((node, block))
+
+        if isinstance(node, BlockNode):
+            node_block = node
+        else:
+            node_block = block
+        for key in getattr(node, 'child_nodelists', ('nodelist',)):
+            child_nodelist = getattr(node, key, None)
+            if child_nodelist:
+                _placeholders_recursif(child_nodelist, scan, node_block)
+
+
+def get_placeholder_metadata(placeholder):
+    """Return a ``dict`` describing a PlaceholderNode: its name, content
+    type, section, widget and flags."""
+    widget = placeholder.widget
+    if not isinstance(widget, six.string_types):
+        widget = widget.__name__
+    return {
+        'name': placeholder.name,
+        'ctype': placeholder.ctype,
+        'section': placeholder.section,
+        'widget': widget,
+        'node': placeholder.__class__.__name__,
+        'page': placeholder.page,
+        'as_varname': placeholder.as_varname,
+        'parsed': placeholder.parsed,
+        'inherited': placeholder.inherited,
+        'untranslated': placeholder.untranslated,
+    }
+
+
+def get_placeholders_manifest(template_names=None):
+    """Return a ``dict`` mapping each template name to the metadata of
+    its placeholders. All the page templates are described by default.
+
+    :param template_names: the names of the template files
+    """
+    if template_names is None:
+        from pages import settings
+        template_names = [settings.PAGE_DEFAULT_TEMPLATE]
+        for name, label in settings.get_page_templates():
+            if name not in template_names:
+                template_names.append(name)
+    return dict(
+        (name, [get_placeholder_metadata(p) for p in get_placeholders(name)])
+        for name in template_names)
+
+
+# process level cache of the page URL prefixes of each URLconf:
+# {key: (resolver, root_url, before, after)}
+_url_prefixes = {}
+
+# a path that is reversed to find the part of the URL around it
+_URL_PATH_MARKER = 'pagespathmarker'
+
+
+def get_url_prefixes(language=None):
+    """Return the URL of the root page, ``None`` if there is no
+    ``pages-root`` URL, and the parts of the ``pages-details-by-path``
+    URL before and after the path of a page.
+
+    They are computed with ``reverse`` once for each URLconf, script
+    prefix, language and active translation, which ``i18n_patterns``
+    adds to the URLs. ``before`` and ``after`` are ``None`` if the URL
+    can't be built that way.
+
+    :param language: the language of the URL prefix.
+    """
+    from pages import settings
+    urlconf = get_urlconf()
+    resolver = get_resolver(urlconf)
+    script_prefix = get_script_prefix()
+    if not settings.PAGE_USE_LANGUAGE_PREFIX:
+        language = None
+    key = (id(resolver), script_prefix, language,
+        translation.get_language())
+    cached = _url_prefixes.get(key)
+    if cached is not None and cached[0] is resolver:
+        return cached[1:]
+
+    try:
+        root_url = reverse('pages-root', urlconf=urlconf)
+    except Exception:
+        root_url = None
+    args = [_URL_PATH_MARKER]
+    if language is not None:
+        args.insert(0, language)
+    try:
+        url = reverse('pages-details-by-path', args=args, urlconf=urlconf)
+    except NoReverseMatch:
+        url = ''
+    if url.count(_URL_PATH_MARKER) == 1:
+        before, after = url.split(_URL_PATH_MARKER)
+    else:
+        before = after = None
+
+    if len(_url_prefixes) > 100:
+        _url_prefixes.clear()
+    _url_prefixes[key] = (resolver, root_url, before, after)
+    return root_url, before, after
+
+
+def reverse_page_path(path, language=None):
+    """Return the ``pages-details-by-path`` URL of a page path, like
+    ``reverse`` would but from the prefixes of :func:`get_url_prefixes`.
+
+    :param path: the complete slug of a page.
+    :param language: the language of the URL prefix.
+    """
+    from pages import settings
+    root_url, before, after = get_url_prefixes(language)
+    if before is None:
+        args = [path]
+        if settings.PAGE_USE_LANGUAGE_PREFIX:
+            args.insert(0, language)
+        return reverse('pages-details-by-path', args=args)
+    return before + urlquote(path,
+        safe=RFC3986_SUBDELIMS + str('/~:@')) + after
 
 
 def normalize_url(url):
@@ -1,7 +1,7 @@
 """Default example views"""
 from pages import settings
 from pages.models import Page, PageAlias
-from pages.phttp import get_language_from_request, remove_slug
+from pages.phttp import get_language_from_request
 from pages.urlconf_registry import get_urlconf
 
 from django.http import Http404, HttpResponsePermanentRedirect
@@ -89,29 +89,12 @@ class Details(object):
         """Return the appropriate page according to the path."""
         path = context['path']
         lang = context['lang']
-        page = Page.objects.from_path(
+        # if the complete path doesn't match a page, the deepest page
+        # of the path that delegates to an application is used. All the
+        # candidate pages are fetched at once.
+        return Page.objects.resolve_path(
             path, lang,
             exclude_drafts=(not is_staff))
-        if page:
-            return page
-        # if the complete path didn't worked out properly
-        # and if didn't used PAGE_USE_STRICT_URL setting we gonna
-        # try to see if it might be a delegation page.
-        # To do that we remove the right part of the url and try again
-        # to find a page that match
-
-        path = remove_slug(path)
-        while path is not None:
-            page = Page.objects.from_path(
-                path, lang,
-                exclude_drafts=(not is_staff))
-            # find a match. Is the page delegating?
-            if page:
-                if page.delegate_to:
-                    return page
-            path = remove_slug(path)
-
-        return None
 
     def resolve_alias(self, request, path, lang):
         alias = PageAlias.objects.from_path(request, path, lang)